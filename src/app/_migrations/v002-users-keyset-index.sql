@@ -0,0 +1,2 @@
+-- supports keyset pagination on (created_at, id), see UsersRepository.get_page_after
+create index if not exists users_created_at_id_idx on users (created_at, id);
@@ -0,0 +1,30 @@
+-- change counter per table, bumped once per statement, used as validator of the conditional GETs, see
+-- UsersRepository.get_version
+create table if not exists table_versions
+(
+    table_name varchar primary key,
+    version    bigint      not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create or replace function bump_table_version() returns trigger as
+$$
+begin
+    insert into table_versions (table_name, version, updated_at)
+    values (tg_table_name, 1, now())
+    on conflict (table_name) do update set version    = table_versions.version + 1,
+                                           updated_at = excluded.updated_at;
+    return null;
+end;
+$$ language plpgsql;
+
+insert into table_versions (table_name)
+values ('users')
+on conflict do nothing;
+
+drop trigger if exists users_bump_table_version on users;
+create trigger users_bump_table_version
+    after insert or update or delete or truncate
+    on users
+    for each statement
+execute function bump_table_version();
@@ -0,0 +1,7 @@
+-- markers of the bootstrap steps already done, e.g. the checksum of the applied migrations, see app.domain.bootstrap
+create table if not exists _bootstrap_state
+(
+    key        varchar primary key,
+    value      varchar     not null,
+    updated_at timestamptz not null default now()
+);
@@ -0,0 +1,20 @@
+-- supports the email prefix filter (email LIKE 'prefix%'), which the unique index on email cannot serve unless the
+-- database collation is C, see UsersFilters
+create index if not exists users_email_pattern_idx on users (email varchar_pattern_ops);
+
+-- supports the updated_at range filter. Row versions are mostly written in updated_at order, so a block range index is
+-- enough and stays tiny. Ranges written since the last vacuum are summarized by autovacuum, until then they are always
+-- scanned. Ranges of created_at are served by users_created_at_id_idx.
+create index if not exists users_updated_at_brin_idx on users using brin (updated_at) with (autosummarize = on);
+
+-- supports the case-insensitive name substring filter (name ILIKE '%term%'). pg_trgm ships with the contrib modules,
+-- on servers without them the filter still works, without an index.
+do
+$$
+begin
+    if exists (select 1 from pg_available_extensions where name = 'pg_trgm') then
+        create extension if not exists pg_trgm;
+        create index if not exists users_name_trgm_idx on users using gin (name gin_trgm_ops);
+    end if;
+end
+$$;
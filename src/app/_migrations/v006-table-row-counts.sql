@@ -0,0 +1,64 @@
+-- row count per table, kept up to date by the triggers below, so that counting a whole table costs a single row read,
+-- see app.datalayer.counting. It lives in table_versions, whose row is already locked by every statement writing to
+-- the table, so keeping it adds no contention.
+alter table table_versions
+    add column if not exists row_count bigint;
+
+-- transition tables can only be declared by single event triggers, hence one function per event
+create or replace function count_inserted_rows() returns trigger as
+$$
+begin
+    update table_versions
+    set row_count = row_count + (select count(*) from new_rows)
+    where table_name = tg_table_name;
+    return null;
+end;
+$$ language plpgsql;
+
+create or replace function count_deleted_rows() returns trigger as
+$$
+begin
+    update table_versions
+    set row_count = row_count - (select count(*) from old_rows)
+    where table_name = tg_table_name;
+    return null;
+end;
+$$ language plpgsql;
+
+create or replace function reset_row_count() returns trigger as
+$$
+begin
+    update table_versions set row_count = 0 where table_name = tg_table_name;
+    return null;
+end;
+$$ language plpgsql;
+
+-- locks the table, so that no row is written between the initial count and the creation of the triggers
+lock table users in share row exclusive mode;
+
+drop trigger if exists users_count_inserted_rows on users;
+create trigger users_count_inserted_rows
+    after insert
+    on users
+    referencing new table as new_rows
+    for each statement
+execute function count_inserted_rows();
+
+drop trigger if exists users_count_deleted_rows on users;
+create trigger users_count_deleted_rows
+    after delete
+    on users
+    referencing old table as old_rows
+    for each statement
+execute function count_deleted_rows();
+
+drop trigger if exists users_reset_row_count on users;
+create trigger users_reset_row_count
+    after truncate
+    on users
+    for each statement
+execute function reset_row_count();
+
+update table_versions
+set row_count = (select count(*) from users)
+where table_name = 'users';
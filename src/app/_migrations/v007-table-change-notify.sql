@@ -0,0 +1,56 @@
+-- notifies the changes of a table on the table_changes channel, once per statement, with the version the statement
+-- bumped (see v003-table-versions) and the ids of the rows it changed, see app.datalayer.change_feed. Payloads are
+-- limited to 8000 bytes, so the ids are left out (null) when more than 100 rows changed, as they are on truncate.
+-- Expects an id column, and the version of the table to be bumped first: same event triggers fire in name order.
+create or replace function notify_table_change() returns trigger as
+$$
+declare
+    changed_ids json;
+begin
+    if tg_op <> 'TRUNCATE' then
+        select coalesce(json_agg(id), '[]') into changed_ids from (select id from changed_rows limit 101) r;
+        if json_array_length(changed_ids) > 100 then
+            changed_ids := null;
+        end if;
+    end if;
+    perform pg_notify('table_changes', json_build_object(
+            'table', tg_table_name,
+            'op', lower(tg_op),
+            'version', (select version from table_versions where table_name = tg_table_name),
+            'ids', changed_ids
+        )::text);
+    return null;
+end;
+$$ language plpgsql;
+
+-- transition tables can only be declared by single event triggers, hence one trigger per event
+drop trigger if exists users_notify_inserted on users;
+create trigger users_notify_inserted
+    after insert
+    on users
+    referencing new table as changed_rows
+    for each statement
+execute function notify_table_change();
+
+drop trigger if exists users_notify_updated on users;
+create trigger users_notify_updated
+    after update
+    on users
+    referencing new table as changed_rows
+    for each statement
+execute function notify_table_change();
+
+drop trigger if exists users_notify_deleted on users;
+create trigger users_notify_deleted
+    after delete
+    on users
+    referencing old table as changed_rows
+    for each statement
+execute function notify_table_change();
+
+drop trigger if exists users_notify_truncated on users;
+create trigger users_notify_truncated
+    after truncate
+    on users
+    for each statement
+execute function notify_table_change();
@@ -1,17 +1,22 @@
 import fastapi
-from starlette.responses import JSONResponse
 
-from app.domain.health_service import HealthService
+from app.core.responses import FastJSONResponse
+from app.domain.health_service import HealthService, get_health_service
 
 router = fastapi.APIRouter()
 
 
 @router.get("")
 async def health(
-    health_service: HealthService = fastapi.Depends(),
+    deep: bool = fastapi.Query(False),
+    health_service: HealthService = fastapi.Depends(get_health_service),
 ):
+    if deep:
+        report = await health_service.deep_check()
+        status_code = 200 if report["status"] == "up" else 503
+        return FastJSONResponse(report, status_code=status_code)
     ok = await health_service.check()
     if ok:
-        return JSONResponse({"status": "up"}, status_code=200)
+        return FastJSONResponse({"status": "up"}, status_code=200)
     else:
-        return JSONResponse({"status": "down"}, status_code=503)
+        return FastJSONResponse({"status": "down"}, status_code=503)
@@ -1,26 +1,272 @@
+import asyncio
+import csv
+import datetime
+import hashlib
+import io
+import json
 import time
+import typing
+import uuid
 
 import fastapi
+import orjson
 import pydantic
+from starlette.responses import Response, StreamingResponse
 
-from app.domain.user_service import UserService, UserDto
+from app.core.conditional import get_validator_headers, is_not_modified
+from app.core.responses import FastJSONResponse
+from app.datalayer.change_feed import ChangeEvent, ChangeSubscription
+from app.datalayer.users import TableVersion, UsersFilters
+from app.domain.user_import import UserImportResult
+from app.domain.user_service import UserService, UserDto, get_user_service
 
 router = fastapi.APIRouter()
 
+_EXPORT_CHUNK_SIZE = 1000
+_EXPORT_COLUMNS = ("id", "email", "name", "created_at", "updated_at")
+_IMPORT_BATCH_SIZE = 5000
+_IMPORT_FORMATS = {"application/x-ndjson": "ndjson", "text/csv": "csv"}
+# comment lines sent while idle, so that proxies do not close the stream
+_CHANGES_KEEPALIVE_SECONDS = 15.0
+
 
 class UserResponse(pydantic.BaseModel):
     elapsed: int
     size: int
     data: list[UserDto]
+    next_cursor: str | None = None
+    # of the users matching the filters, None when counting is disabled, see CountConfig
+    total: int | None = None
+    # whether total comes from the planner statistics instead of an exact count
+    total_is_estimate: bool = False
+
+
+class UserImportResponse(UserImportResult):
+    elapsed: int
+
 
+def user_row_to_json(row: tuple) -> dict:
+    """
+    Same JSON representation as UserDto, built straight from a (id, email, name, created_at, updated_at) row. UUID
+    and datetime values are left to FastJSONResponse, which encodes them natively.
+    """
+    return {
+        "id": row[0],
+        "email": row[1],
+        "name": row[2],
+        "created_at": row[3],
+        "updated_at": row[4],
+    }
 
-@router.get("")
+
+def render_user_response(
+    rows: list[tuple],
+    elapsed: int,
+    size: int,
+    next_cursor: str | None,
+    total: int | None = None,
+    total_is_estimate: bool = False,
+) -> FastJSONResponse:
+    # Same body as UserResponse, skipping the per-row validation of UserDto and jsonable_encoder.
+    return FastJSONResponse(
+        {
+            "elapsed": elapsed,
+            "size": size,
+            "data": [user_row_to_json(r) for r in rows],
+            "next_cursor": next_cursor,
+            "total": total,
+            "total_is_estimate": total_is_estimate,
+        }
+    )
+
+
+@router.get("", response_model=UserResponse)
 async def get_users(
-    size: int = fastapi.Query(100),
-    user_service: UserService = fastapi.Depends(),
+    request: fastapi.Request,
+    size: int = fastapi.Query(100, ge=1),
+    cursor: str | None = fastapi.Query(None),
+    email_prefix: str | None = fastapi.Query(
+        None, description="Emails starting with it, case-sensitive"
+    ),
+    name: str | None = fastapi.Query(
+        None, description="Names containing it, case-insensitive"
+    ),
+    created_from: datetime.datetime | None = fastapi.Query(None),
+    created_to: datetime.datetime | None = fastapi.Query(None, description="Exclusive"),
+    updated_from: datetime.datetime | None = fastapi.Query(None),
+    updated_to: datetime.datetime | None = fastapi.Query(None, description="Exclusive"),
+    user_service: UserService = fastapi.Depends(get_user_service),
+):
+    filters = UsersFilters(
+        email_prefix=email_prefix,
+        name_contains=name,
+        created_from=created_from,
+        created_to=created_to,
+        updated_from=updated_from,
+        updated_to=updated_to,
+    )
+    # The page only changes when the table does, clients polling with If-None-Match get a 304 without reading any
+    # user. The version and the page are read together, see UsersRepository.get_page_with_version, so the ETag is
+    # never newer than the page, even when reads go to replicas lagging differently.
+    page_key = f"{size}:{cursor}:{filters.model_dump_json(exclude_none=True)}"
+    page = hashlib.blake2b(page_key.encode(), digest_size=8).hexdigest()
+
+    def _get_headers(version: TableVersion) -> dict:
+        return get_validator_headers(
+            f'W/"{version.version}-{page}"', version.updated_at
+        )
+
+    def _is_modified(version: TableVersion) -> bool:
+        return not is_not_modified(
+            request, _get_headers(version)["etag"], version.updated_at
+        )
+
+    start = time.perf_counter() * 1000
+    version, rows, next_cursor = await user_service.get_user_page(
+        size, cursor, filters, is_modified=_is_modified
+    )
+    headers = _get_headers(version)
+    # a cached page comes with its version, whatever it is
+    if rows is None or not _is_modified(version):
+        return Response(status_code=304, headers=headers)
+    # constant cost with the default strategy (counter or estimate), unlike COUNT(*)
+    count = await user_service.count_users(filters, version)
+    end = time.perf_counter() * 1000
+    elapsed = int(end - start)
+    response = render_user_response(
+        rows,
+        elapsed,
+        size,
+        next_cursor,
+        total=count.total if count is not None else None,
+        total_is_estimate=count.is_estimate if count is not None else False,
+    )
+    response.headers.update(headers)
+    return response
+
+
+async def _export_ndjson(
+    chunks: typing.AsyncIterator[list[tuple]],
+) -> typing.AsyncIterator[bytes]:
+    async for rows in chunks:
+        # Encoded like the JSON responses, see FastJSONResponse. The ids of the raw asyncpg rows are asyncpg's own UUID
+        # type, which orjson does not know.
+        yield b"".join(
+            orjson.dumps(
+                user_row_to_json(r), default=str, option=orjson.OPT_APPEND_NEWLINE
+            )
+            for r in rows
+        )
+
+
+async def _export_csv(
+    chunks: typing.AsyncIterator[list[tuple]],
+) -> typing.AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(_EXPORT_COLUMNS)
+    async for rows in chunks:
+        writer.writerows(
+            (r[0], r[1], r[2], r[3].isoformat(), r[4].isoformat()) for r in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@router.get("/export")
+async def export_users(
+    format: typing.Literal["ndjson", "csv"] = fastapi.Query("ndjson"),
+    user_service: UserService = fastapi.Depends(get_user_service),
 ):
+    chunks = user_service.iter_users(chunk_size=_EXPORT_CHUNK_SIZE)
+    if format == "csv":
+        return StreamingResponse(
+            _export_csv(chunks),
+            media_type="text/csv",
+            headers={"content-disposition": 'attachment; filename="users.csv"'},
+        )
+    return StreamingResponse(_export_ndjson(chunks), media_type="application/x-ndjson")
+
+
+@router.post("/bulk", response_model=UserImportResponse)
+async def import_users(
+    request: fastapi.Request,
+    user_service: UserService = fastapi.Depends(get_user_service),
+):
+    """
+    Imports users from an NDJSON (application/x-ndjson) or CSV (text/csv, with an email,name header) body. The body
+    is streamed, so its size is not limited by memory. Invalid rows are skipped and reported, existing emails are
+    skipped.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    format = _IMPORT_FORMATS.get(content_type)
+    if format is None:
+        raise fastapi.HTTPException(
+            status_code=415,
+            detail=f"unsupported content type, expected one of {list(_IMPORT_FORMATS)}",
+        )
     start = time.perf_counter() * 1000
-    data = await user_service.get_users(size)
+    result = await user_service.import_users(
+        request.stream(), format, batch_size=_IMPORT_BATCH_SIZE
+    )
     end = time.perf_counter() * 1000
     elapsed = int(end - start)
-    return UserResponse(data=data, elapsed=elapsed, size=size)
+    return UserImportResponse(elapsed=elapsed, **result.model_dump())
+
+
+def _format_change_event(event: ChangeEvent) -> bytes:
+    data = json.dumps(event.to_json(), separators=(",", ":"))
+    if event.version is None:
+        return f"event: {event.op}\ndata: {data}\n\n".encode()
+    return f"id: {event.version}\nevent: {event.op}\ndata: {data}\n\n".encode()
+
+
+async def _stream_changes(
+    subscribe: typing.ContextManager[ChangeSubscription],
+    resync: bool,
+) -> typing.AsyncIterator[bytes]:
+    with subscribe as subscription:
+        yield b"retry: 1000\n\n"
+        if resync:
+            yield _format_change_event(ChangeEvent("users", "resync"))
+        while True:
+            try:
+                async with asyncio.timeout(_CHANGES_KEEPALIVE_SECONDS):
+                    event = await subscription.get()
+            except TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield _format_change_event(event)
+
+
+@router.get("/changes")
+async def watch_user_changes(
+    last_event_id: str | None = fastapi.Header(None),
+    user_service: UserService = fastapi.Depends(get_user_service),
+):
+    """
+    Server-sent events of the changes of the users, made by any process. Event ids are the versions of the users
+    table, see the ETag of GET /api/users. A resync event means that anything may have changed, e.g. after the
+    stream resumes past missed changes (Last-Event-ID), and the users must be read again.
+    """
+    subscribe = user_service.subscribe_user_changes()
+    if subscribe is None:
+        raise fastapi.HTTPException(status_code=503, detail="change feed disabled")
+    resync = last_event_id is not None and last_event_id != str(
+        user_service.get_known_users_version()
+    )
+    return StreamingResponse(
+        _stream_changes(subscribe, resync),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
+
+
+@router.get("/{id}", response_model=UserDto)
+async def get_user(
+    id: uuid.UUID,
+    user_service: UserService = fastapi.Depends(get_user_service),
+):
+    row = await user_service.get_user_row(id)
+    return FastJSONResponse(user_row_to_json(row))
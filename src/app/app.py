@@ -4,30 +4,70 @@ import os
 import typing
 
 import fastapi
-from asyncpg_datalayer.db_factory import create_db
-from asyncpg_datalayer.migrationtool.main import apply_migrations
 from starlette.responses import RedirectResponse
 
-from app import migrations_dir
 from app.api.api_factory import setup_api
+from app.core.admission import setup_admission_control
+from app.core.cache import create_cache
+from app.core.compression import setup_compression
+from app.core.container import Container
+from app.core.deadline import setup_deadline
 from app.core.config import AppConfig
-from app.core.correlation_id import setup_correlation_id
 from app.core.error_handlers import setup_error_handlers
 from app.core.logs import setup_logging
-from app.core.prometheus import setup_prometheus
-from app.domain.create_some_data import create_some_data
+from app.core.loop_monitor import create_loop_monitor
+from app.core.prometheus import setup_prometheus, teardown_prometheus
+from app.core.request_middleware import setup_request_middleware
+from app.core.responses import FastJSONResponse
+from app.core.startup import StartupTimer
+from app.datalayer.batch_loader import BatchLoader
+from app.datalayer.change_feed import create_change_feed
+from app.datalayer.routing import (
+    ReadYourWritesMiddleware,
+    RoutingDB,
+    create_routing_db,
+)
+from app.datalayer.facade import DatalayerFacade
+from app.datalayer.users import UsersRepository
+from app.domain.bootstrap import bootstrap
+from app.domain.health_monitor import HealthMonitor
+from app.domain.health_service import HealthService
+from app.domain.user_service import UserService
 
 
 @contextlib.asynccontextmanager
 async def _lifespan(app: "App"):
     app.logger.info(f"Starting 🔄")
-    await apply_migrations(app.db.postgres_url, migrations_dir)
-    await create_some_data(app.db)
-    # ...
-    app.logger.info("Started ✅ ")
+    timer = StartupTimer()
+    if app.loop_monitor is not None:
+        # first, so that a startup blocking the loop is reported too
+        await app.loop_monitor.start()
+    with timer.phase("startup"):
+        if app.config.BOOTSTRAP_ON_STARTUP:
+            with timer.phase("bootstrap"):
+                await bootstrap(app.db, timer)
+        with timer.phase("health_monitor"):
+            await app.health_monitor.start()
+        if isinstance(app.db, RoutingDB):
+            with timer.phase("replicas"):
+                await app.db.start()
+        if app.change_feed is not None:
+            # after bootstrap, which creates the triggers
+            with timer.phase("change_feed"):
+                await app.change_feed.start(timeout=5)
+        # ...
+    app.logger.info(f"Started ✅ {timer}", extra={"data": timer.to_dict()})
     yield
     app.logger.info("Shutting down 🔄")
+    await app.health_monitor.stop()
+    if app.change_feed is not None:
+        await app.change_feed.stop()
+    if isinstance(app.db, RoutingDB):
+        await app.db.stop()
     await app.db.disconnect()
+    if app.loop_monitor is not None:
+        await app.loop_monitor.stop()
+    teardown_prometheus()
     # ...
     app.logger.info("Shutdown 🛑")
 
@@ -45,6 +85,7 @@ class App(fastapi.FastAPI):
 
         super().__init__(
             lifespan=_lifespan,
+            default_response_class=FastJSONResponse,
             title=f"{self.config.get_app_name()} API",
             description="[GitHub](https://github.com/zym-tools/zym-be)",
             version=self.config.VERSION,
@@ -53,8 +94,19 @@ class App(fastapi.FastAPI):
             **extra,
         )
 
-        # Setup ASGI Correlation ID middleware
-        setup_correlation_id(self)
+        # Compress responses. Added first, the innermost middleware, so that compression runs within an admission slot.
+        setup_compression(self, self.config.compression)
+
+        # Queue requests ahead of the DB pool. Added before the request middleware, so that it runs within it and
+        # rejections carry the request id.
+        setup_admission_control(self, self.config.admission)
+
+        # Deadline of the requests, propagated to the DB, and cancellation on client disconnect. Runs outside admission
+        # control, so that the wait for a slot counts towards the deadline and is abandoned on disconnect.
+        setup_deadline(self, self.config.deadline)
+
+        # Request id, timing and request metrics, in a single pure ASGI middleware
+        setup_request_middleware(self)
 
         # Http error handlers (equivalent to try block that can handle uncaught exceptions)
         setup_error_handlers(self)
@@ -62,11 +114,51 @@ class App(fastapi.FastAPI):
         # Setup API
         setup_api(self)
 
-        # Setup prometheus metrics
+        # Expose prometheus metrics, requests are instrumented by the request middleware
         setup_prometheus(self)
 
-        self.db = create_db(os.environ)
+        self.db = create_routing_db(self.config.replicas, self.config.sql, os.environ)
         self.state.db = self.db
+        if isinstance(self.db, RoutingDB):
+            # reads of a request go to the primary once it has written, see pin_to_primary
+            self.add_middleware(ReadYourWritesMiddleware)
+
+        self.cache = create_cache(self.config.cache)
+        self.state.cache = self.cache
+
+        # concurrent lookups of users by id, from any request, are loaded together
+        self.user_loader = BatchLoader(
+            "users", UsersRepository(self.db).get_rows_by_ids
+        )
+        self.state.user_loader = self.user_loader
+
+        # event loop lag, and callbacks blocking the loop reported with their stack
+        self.loop_monitor = create_loop_monitor(self.config.loop_monitor)
+        self.state.loop_monitor = self.loop_monitor
+
+        self.health_monitor = HealthMonitor(self.db, self.config.health)
+        self.state.health_monitor = self.health_monitor
+
+        # changes of the tables notified by Postgres, so that caches follow the writes of every process
+        self.change_feed = create_change_feed(self.db, self.config.change_feed)
+        self.state.change_feed = self.change_feed
+
+        # services are stateless, built once and shared by all requests
+        self.container = Container()
+        facade = DatalayerFacade(self.db, self.cache, self.user_loader.request_scoped())
+        self.container.register(DatalayerFacade, facade)
+        if self.change_feed is not None:
+            self.change_feed.add_listener(facade.users.on_change)
+        self.container.register(
+            UserService,
+            UserService(facade, self.config.count.COUNT_STRATEGY, self.change_feed),
+        )
+        self.container.register(
+            HealthService,
+            HealthService(
+                self.db, self.health_monitor, getattr(self.state, "admission", None)
+            ),
+        )
 
         if hasattr(self, "docs_url") and self.docs_url:
 
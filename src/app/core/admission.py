@@ -0,0 +1,199 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+
+import fastapi
+import pydantic_settings
+from asgi_correlation_id import correlation_id
+from prometheus_client import Counter, Gauge, Histogram
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.responses import FastJSONResponse
+
+_QUEUE_DEPTH = Gauge(
+    "app_admission_queue_depth",
+    "Requests waiting for an admission slot",
+    multiprocess_mode="livesum",
+)
+_IN_FLIGHT = Gauge(
+    "app_admission_in_flight",
+    "Requests holding an admission slot",
+    multiprocess_mode="livesum",
+)
+_WAIT_SECONDS = Histogram(
+    "app_admission_wait_seconds",
+    "Time spent waiting for an admission slot",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+_REJECTED = Counter(
+    "app_admission_rejected_total", "Requests shed by admission control", ["reason"]
+)
+
+
+class AdmissionConfig(pydantic_settings.BaseSettings):
+    ADMISSION_ENABLED: bool = True
+    # defaults to the size of the DB pool, i.e. POOL_SIZE + POOL_MAX_OVERFLOW
+    ADMISSION_MAX_CONCURRENCY: int | None = None
+    ADMISSION_MAX_QUEUE: int = 100
+    ADMISSION_MAX_WAIT_MS: int = 5000
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+    # paths (prefixes) that never wait for a slot
+    ADMISSION_EXEMPT_PATHS: list[str] = [
+        "/api/health",
+        # long-lived stream of events, holds no DB connection
+        "/api/users/changes",
+        "/metrics",
+        "/api/docs",
+        "/api/openapi.json",
+    ]
+    # paths (prefixes) mapped to their priority, lower goes first, the default is 0
+    ADMISSION_ROUTE_PRIORITIES: dict[str, int] = {}
+    # same defaults as SQLAlchemy QueuePool
+    POOL_SIZE: int = 5
+    POOL_MAX_OVERFLOW: int = 10
+
+    def get_max_concurrency(self) -> int:
+        if self.ADMISSION_MAX_CONCURRENCY is not None:
+            return self.ADMISSION_MAX_CONCURRENCY
+        return self.POOL_SIZE + self.POOL_MAX_OVERFLOW
+
+
+class PrioritySemaphore:
+    """
+    Semaphore whose waiters are woken up by priority (lower first), then in arrival order.
+    """
+
+    def __init__(self, limit: int) -> None:
+        super().__init__()
+        self._available = limit
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int, timeout: float) -> None:
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # the slot was handed over right when we gave up, pass it on
+                self.release()
+            else:
+                # release() may have popped it already, skipping it as cancelled
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._available += 1
+
+
+class AdmissionControlMiddleware:
+    """
+    Limits the number of requests processed concurrently to what the DB pool can serve, so that bursts wait in a
+    bounded queue instead of failing on pool overflow. Requests are rejected with 429 and Retry-After when the queue
+    is full, when their expected wait exceeds the deadline, or when the deadline expires while waiting.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        config: AdmissionConfig,
+        semaphore: PrioritySemaphore,
+    ) -> None:
+        super().__init__()
+        self.app = app
+        self.config = config
+        self.logger = logging.getLogger(f"{self.__module__}.{type(self).__name__}")
+        self._limit = config.get_max_concurrency()
+        self._semaphore = semaphore
+        self._max_wait = config.ADMISSION_MAX_WAIT_MS / 1000
+        self._exempt_paths = tuple(config.ADMISSION_EXEMPT_PATHS)
+        # longest prefix first, so that the most specific one wins
+        self._priorities = sorted(
+            config.ADMISSION_ROUTE_PRIORITIES.items(), key=lambda i: -len(i[0])
+        )
+        # moving average of how long a request holds its slot, used to estimate the wait of new requests
+        self._avg_hold_time = 0.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self._exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        if self._semaphore.queued >= self.config.ADMISSION_MAX_QUEUE:
+            await self._reject("queue_full", scope, receive, send)
+            return
+        expected_wait = (self._semaphore.queued + 1) * self._avg_hold_time / self._limit
+        if self._semaphore.queued and expected_wait > self._max_wait:
+            await self._reject("expected_wait", scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        _QUEUE_DEPTH.inc()
+        try:
+            await self._semaphore.acquire(self._get_priority(scope), self._max_wait)
+        except TimeoutError:
+            await self._reject("timeout", scope, receive, send)
+            return
+        finally:
+            _QUEUE_DEPTH.dec()
+        acquired = time.perf_counter()
+        _WAIT_SECONDS.observe(acquired - start)
+
+        _IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _IN_FLIGHT.dec()
+            self._semaphore.release()
+            hold_time = time.perf_counter() - acquired
+            self._avg_hold_time += 0.1 * (hold_time - self._avg_hold_time)
+
+    def _get_priority(self, scope: Scope) -> int:
+        path = scope["path"]
+        for prefix, priority in self._priorities:
+            if path.startswith(prefix):
+                return priority
+        return 0
+
+    async def _reject(self, reason: str, scope: Scope, receive: Receive, send: Send):
+        _REJECTED.labels(reason).inc()
+        self.logger.warning(f"Request rejected by admission control ({reason})")
+        # same body as app.core.error_handlers
+        response = FastJSONResponse(
+            {
+                "status_code": 429,
+                "message": "too many requests",
+                "request_id": correlation_id.get(),
+            },
+            status_code=429,
+            headers={"retry-after": str(self.config.ADMISSION_RETRY_AFTER_SECONDS)},
+        )
+        await response(scope, receive, send)
+
+
+def setup_admission_control(app: fastapi.FastAPI, config: AdmissionConfig) -> None:
+    if config.ADMISSION_ENABLED:
+        # kept in app.state to report the number of waiting requests, see HealthService
+        app.state.admission = PrioritySemaphore(config.get_max_concurrency())
+        app.add_middleware(
+            AdmissionControlMiddleware, config=config, semaphore=app.state.admission
+        )
@@ -0,0 +1,177 @@
+import abc
+import asyncio
+import collections
+import contextvars
+import functools
+import pickle
+import time
+import typing
+
+import pydantic_settings
+from prometheus_client import Counter, Gauge
+
+T = typing.TypeVar("T")
+
+_CACHE_HITS = Counter("app_cache_hits_total", "Cache hits", ["namespace"])
+_CACHE_MISSES = Counter("app_cache_misses_total", "Cache misses", ["namespace"])
+_CACHE_COALESCED = Counter(
+    "app_cache_coalesced_total",
+    "Cache misses served by an identical load already in flight",
+    ["namespace"],
+)
+_CACHE_EVICTIONS = Counter(
+    "app_cache_evictions_total", "Cache entries evicted", ["reason"]
+)
+_CACHE_SIZE_BYTES = Gauge(
+    "app_cache_size_bytes", "Bytes held by the local cache", multiprocess_mode="livesum"
+)
+
+
+class CacheConfig(pydantic_settings.BaseSettings):
+    CACHE_ENABLED: bool = False
+    # bounds how stale entries can be when the change feed is off or down, see ChangeFeed
+    CACHE_TTL_SECONDS: float = 5.0
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+
+class CacheBackend(abc.ABC):
+    """
+    Storage of a Cache. Values are opaque bytes and keys are prefixed by their namespace ("<namespace>:<key>"),
+    so a shared cache (e.g. Redis) can implement it too.
+    """
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> bytes | None: ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    @abc.abstractmethod
+    async def invalidate(self, namespace: str) -> None: ...
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    In-process LRU with TTL, bounded by the total size in bytes of keys and values.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__()
+        self.max_bytes = max_bytes
+        self._size = 0
+        self._entries: collections.OrderedDict[str, tuple[float, bytes]] = (
+            collections.OrderedDict()
+        )
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            _CACHE_EVICTIONS.labels("expired").inc()
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._size += size
+        while self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            _CACHE_EVICTIONS.labels("size").inc()
+        _CACHE_SIZE_BYTES.set(self._size)
+
+    async def invalidate(self, namespace: str) -> None:
+        prefix = f"{namespace}:"
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            self._remove(key)
+            _CACHE_EVICTIONS.labels("invalidated").inc()
+        _CACHE_SIZE_BYTES.set(self._size)
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._size -= len(key) + len(value)
+
+
+class Cache:
+    """
+    Read-through cache: concurrent misses of the same key share a single load, and loads that started before an
+    invalidation of their namespace are not stored.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float) -> None:
+        super().__init__()
+        self.backend = backend
+        self.ttl = ttl
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._generations: collections.Counter[str] = collections.Counter()
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        key: str,
+        loader: typing.Callable[[], typing.Awaitable[T]],
+    ) -> T:
+        full_key = f"{namespace}:{key}"
+        cached = await self.backend.get(full_key)
+        if cached is not None:
+            _CACHE_HITS.labels(namespace).inc()
+            return pickle.loads(cached)
+
+        _CACHE_MISSES.labels(namespace).inc()
+        task = self._inflight.get(full_key)
+        if task is not None:
+            _CACHE_COALESCED.labels(namespace).inc()
+        else:
+            # The load is shared, so it runs in its own task and in an empty context: neither the cancellation of the
+            # request that started it (e.g. on client disconnect) nor its deadline can fail the others waiting for it.
+            task = asyncio.create_task(
+                self._load(namespace, full_key, loader),
+                context=contextvars.Context(),
+            )
+            self._inflight[full_key] = task
+            task.add_done_callback(functools.partial(self._on_loaded, full_key))
+        # shield: a cancelled waiter must not cancel the load shared with the others
+        return await asyncio.shield(task)
+
+    async def _load(
+        self,
+        namespace: str,
+        full_key: str,
+        loader: typing.Callable[[], typing.Awaitable[T]],
+    ) -> T:
+        generation = self._generations[namespace]
+        value = await loader()
+        if generation == self._generations[namespace]:
+            await self.backend.set(full_key, pickle.dumps(value), self.ttl)
+        return value
+
+    def _on_loaded(self, full_key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(full_key) is task:
+            del self._inflight[full_key]
+        if not task.cancelled():
+            # mark the exception as retrieved, in case every waiter is gone
+            task.exception()
+
+    async def invalidate(self, namespace: str) -> None:
+        self._generations[namespace] += 1
+        # misses from now on must not join the loads started before
+        prefix = f"{namespace}:"
+        for full_key in [k for k in self._inflight if k.startswith(prefix)]:
+            del self._inflight[full_key]
+        await self.backend.invalidate(namespace)
+
+
+def create_cache(config: CacheConfig) -> Cache | None:
+    if not config.CACHE_ENABLED:
+        return None
+    backend = LocalCacheBackend(max_bytes=config.CACHE_MAX_BYTES)
+    return Cache(backend, ttl=config.CACHE_TTL_SECONDS)
@@ -0,0 +1,239 @@
+import abc
+import zlib
+
+import anyio.to_thread
+import brotli
+import fastapi
+import pydantic_settings
+import zstandard
+from prometheus_client import Counter
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+_COMPRESSED_BYTES = Counter(
+    "app_response_compression_bytes_total",
+    "Bytes of the compressed responses, before (in) and after (out) compression",
+    ["encoding", "stage"],
+)
+
+# never compressed: already compressed, or must reach the client as soon as written
+_EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/")
+
+
+class CompressionConfig(pydantic_settings.BaseSettings):
+    COMPRESSION_ENABLED: bool = True
+    # in order of preference, when the client accepts more than one
+    COMPRESSION_ENCODINGS: list[str] = ["zstd", "br", "gzip"]
+    # smaller responses are sent as they are
+    COMPRESSION_MIN_SIZE: int = 1024
+    # larger bodies (or chunks) are compressed in a worker thread, not to block the event loop
+    COMPRESSION_OFFLOAD_SIZE: int = 256 * 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
+
+class Compressor(abc.ABC):
+    """
+    Streaming compressor: every call of compress returns what the client can decompress so far.
+    """
+
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes: ...
+
+    @abc.abstractmethod
+    def finish(self) -> bytes: ...
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int) -> None:
+        super().__init__()
+        # wbits 16 + 15 means gzip container, maximum window
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, quality: int) -> None:
+        super().__init__()
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int) -> None:
+        super().__init__()
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+_SUPPORTED_ENCODINGS = ("zstd", "br", "gzip")
+
+
+def get_available_encodings(config: CompressionConfig) -> list[str]:
+    return [e for e in config.COMPRESSION_ENCODINGS if e in _SUPPORTED_ENCODINGS]
+
+
+def negotiate_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """
+    Picks the first of `encodings` (in order of preference) accepted by the client, see
+    https://www.rfc-editor.org/rfc/rfc9110#field.accept-encoding. Returns None when none is.
+    """
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, *params = item.strip().split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in encodings:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with the best encoding accepted by the client (Accept-Encoding). Responses smaller than
+    COMPRESSION_MIN_SIZE are not compressed, streaming responses are compressed chunk by chunk, and bodies (or
+    chunks) larger than COMPRESSION_OFFLOAD_SIZE are compressed in a worker thread.
+    """
+
+    def __init__(self, app: ASGIApp, config: CompressionConfig) -> None:
+        super().__init__()
+        self.app = app
+        self.config = config
+        self.encodings = get_available_encodings(config)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.encodings
+        )
+        responder = _CompressionResponder(self.app, self.config, encoding)
+        await responder(scope, receive, send)
+
+
+def _create_compressor(config: CompressionConfig, encoding: str) -> Compressor:
+    if encoding == "zstd":
+        return ZstdCompressor(config.COMPRESSION_ZSTD_LEVEL)
+    if encoding == "br":
+        return BrotliCompressor(config.COMPRESSION_BROTLI_QUALITY)
+    return GzipCompressor(config.COMPRESSION_GZIP_LEVEL)
+
+
+class _CompressionResponder:
+    def __init__(
+        self, app: ASGIApp, config: CompressionConfig, encoding: str | None
+    ) -> None:
+        super().__init__()
+        self.app = app
+        self.config = config
+        self.encoding = encoding
+        self.send: Send | None = None
+        self.start_message: Message | None = None
+        # None until the first body message decides it
+        self.compressor: Compressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # held back until the first body message, which tells whether to compress
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                message["status"] in (204, 304)
+                or "content-encoding" in headers
+                or headers.get("content-type", "").startswith(_EXCLUDED_CONTENT_TYPES)
+            )
+            if not self.passthrough:
+                MutableHeaders(raw=message["headers"]).add_vary_header(
+                    "Accept-Encoding"
+                )
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            small = not more_body and len(body) < self.config.COMPRESSION_MIN_SIZE
+            if self.passthrough or self.encoding is None or small:
+                self.passthrough = True
+                await self.send(start_message)
+                await self.send(message)
+                return
+            self.compressor = _create_compressor(self.config, self.encoding)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["content-encoding"] = self.encoding
+            if not more_body:
+                compressed = await self._compress(body, finish=True)
+                headers["content-length"] = str(len(compressed))
+                await self.send(start_message)
+                await self.send({**message, "body": compressed})
+                return
+            # streamed, the length is not known in advance
+            del headers["content-length"]
+            await self.send(start_message)
+
+        if self.passthrough:
+            await self.send(message)
+            return
+        compressed = await self._compress(body, finish=not more_body)
+        await self.send({**message, "body": compressed})
+
+    async def _compress(self, data: bytes, finish: bool) -> bytes:
+        if len(data) >= self.config.COMPRESSION_OFFLOAD_SIZE:
+            compressed = await anyio.to_thread.run_sync(
+                self._compress_sync, data, finish
+            )
+        else:
+            compressed = self._compress_sync(data, finish)
+        _COMPRESSED_BYTES.labels(self.encoding, "in").inc(len(data))
+        _COMPRESSED_BYTES.labels(self.encoding, "out").inc(len(compressed))
+        return compressed
+
+    def _compress_sync(self, data: bytes, finish: bool) -> bytes:
+        compressed = self.compressor.compress(data) if data else b""
+        if finish:
+            compressed += self.compressor.finish()
+        return compressed
+
+
+def setup_compression(app: fastapi.FastAPI, config: CompressionConfig) -> None:
+    if config.COMPRESSION_ENABLED:
+        app.add_middleware(CompressionMiddleware, config=config)
@@ -0,0 +1,40 @@
+import datetime
+import email.utils
+
+import fastapi
+
+
+def get_validator_headers(etag: str, last_modified: datetime.datetime) -> dict:
+    return {
+        "etag": etag,
+        "last-modified": email.utils.format_datetime(last_modified, usegmt=True),
+    }
+
+
+def is_not_modified(
+    request: fastapi.Request,
+    etag: str,
+    last_modified: datetime.datetime,
+) -> bool:
+    """
+    Whether a conditional GET can be answered with 304, see https://www.rfc-editor.org/rfc/rfc9110#section-13.2.2.
+    If-None-Match takes precedence over If-Modified-Since, and ETags are compared weakly.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        candidates = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return etag.removeprefix("W/") in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            # "-0000" dates are parsed as naive, their time is UTC
+            since = since.replace(tzinfo=datetime.UTC)
+        # HTTP dates have a resolution of one second
+        return last_modified.replace(microsecond=0) <= since
+    return False
@@ -1,14 +1,36 @@
 import pydantic
 import pydantic_settings
 
+from app.core.admission import AdmissionConfig
+from app.core.cache import CacheConfig
+from app.core.compression import CompressionConfig
+from app.core.deadline import DeadlineConfig
 from app.core.logs import LogConfig
+from app.core.loop_monitor import LoopMonitorConfig
+from app.datalayer.change_feed import ChangeFeedConfig
+from app.datalayer.counting import CountConfig
+from app.datalayer.instrumentation import SqlConfig
+from app.datalayer.routing import ReplicaConfig
+from app.domain.health_monitor import HealthConfig
 
 
 class AppConfig(pydantic_settings.BaseSettings):
     APP_NAME: str = "foobar"
     VERSION: str = "undefined"
     DOCS_ENABLED: bool = False
+    # disabled by app.serve, which runs migrations and seed data once before starting the workers
+    BOOTSTRAP_ON_STARTUP: bool = True
     log: LogConfig = pydantic.Field(default_factory=LogConfig)
+    loop_monitor: LoopMonitorConfig = pydantic.Field(default_factory=LoopMonitorConfig)
+    cache: CacheConfig = pydantic.Field(default_factory=CacheConfig)
+    compression: CompressionConfig = pydantic.Field(default_factory=CompressionConfig)
+    admission: AdmissionConfig = pydantic.Field(default_factory=AdmissionConfig)
+    deadline: DeadlineConfig = pydantic.Field(default_factory=DeadlineConfig)
+    health: HealthConfig = pydantic.Field(default_factory=HealthConfig)
+    replicas: ReplicaConfig = pydantic.Field(default_factory=ReplicaConfig)
+    sql: SqlConfig = pydantic.Field(default_factory=SqlConfig)
+    count: CountConfig = pydantic.Field(default_factory=CountConfig)
+    change_feed: ChangeFeedConfig = pydantic.Field(default_factory=ChangeFeedConfig)
 
     def get_app_name(self):
         return self.APP_NAME.capitalize()
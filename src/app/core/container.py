@@ -0,0 +1,52 @@
+import contextlib
+import contextvars
+import typing
+
+import fastapi
+
+T = typing.TypeVar("T")
+
+# services replaced within the current context, see Container.override
+_overrides: contextvars.ContextVar[dict[type, typing.Any] | None] = (
+    contextvars.ContextVar("container_overrides", default=None)
+)
+
+
+class Container:
+    """
+    App-scoped services, built once at startup and shared by every request, so that neither their construction nor
+    the resolution of their dependencies happens per request. Services must therefore be stateless, per-request state
+    belongs to get_request_state. A service can be replaced within the current context with override(), e.g. in a
+    test or for a single request, or per app with FastAPI dependency_overrides on its getter.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._services: dict[type, typing.Any] = {}
+
+    def register(self, service_type: type[T], service: T) -> None:
+        self._services[service_type] = service
+
+    def get(self, service_type: type[T]) -> T:
+        overrides = _overrides.get()
+        if overrides is not None and service_type in overrides:
+            return overrides[service_type]
+        try:
+            return self._services[service_type]
+        except KeyError:
+            raise LookupError(f"{service_type.__name__} not registered") from None
+
+    @contextlib.contextmanager
+    def override(self, service_type: type[T], service: T) -> typing.Iterator[T]:
+        token = _overrides.set({**(_overrides.get() or {}), service_type: service})
+        try:
+            yield service
+        finally:
+            _overrides.reset(token)
+
+
+def get_container(request: fastapi.Request) -> Container:
+    container = getattr(request.app, "container", None)
+    if container is None:
+        raise RuntimeError("Container not found in app, see App")
+    return container
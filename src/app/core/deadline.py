@@ -0,0 +1,189 @@
+import asyncio
+import contextvars
+import logging
+
+import fastapi
+import pydantic_settings
+from prometheus_client import Counter
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+_DISCONNECTED = Counter(
+    "app_request_disconnected_total",
+    "Requests cancelled because the client disconnected before the response was sent",
+)
+
+# monotonic time (loop.time()) by which the current request must be done, see DeadlineMiddleware
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+class DeadlineConfig(pydantic_settings.BaseSettings):
+    DEADLINE_ENABLED: bool = True
+    # set by the client, in milliseconds, capped by DEADLINE_MAX_MS
+    DEADLINE_HEADER: str = "x-request-timeout-ms"
+    DEADLINE_DEFAULT_MS: int = 30000
+    DEADLINE_MAX_MS: int = 60000
+    # paths (prefixes) mapped to their default deadline, also their maximum, the longest prefix wins
+    DEADLINE_ROUTE_MS: dict[str, int] = {
+        "/api/users/export": 600000,
+        "/api/users/bulk": 600000,
+    }
+    # paths (prefixes) without deadline
+    DEADLINE_EXEMPT_PATHS: list[str] = ["/metrics"]
+
+
+class DeadlineExceededException(Exception):
+    """
+    Raised when the deadline of the request expires, e.g. while waiting for a connection, or when a statement is
+    cancelled by its statement_timeout. Mapped to 504 Gateway Timeout.
+    """
+
+
+def get_remaining_time() -> float | None:
+    """
+    Seconds left before the deadline of the current request, None when there is no deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+class DeadlineMiddleware:
+    """
+    Gives every request a deadline, from the DEADLINE_HEADER request header or the defaults of its route, which
+    bounds its DB work (see InstrumentedDB.get_session). Also cancels the request when the client disconnects, so that
+    abandoned requests release their DB connection and their in-flight query right away.
+    """
+
+    def __init__(self, app: ASGIApp, config: DeadlineConfig) -> None:
+        super().__init__()
+        self.app = app
+        self.config = config
+        self.logger = logging.getLogger(f"{self.__module__}.{type(self).__name__}")
+        self._header = config.DEADLINE_HEADER.lower().encode("latin-1")
+        self._exempt_paths = tuple(config.DEADLINE_EXEMPT_PATHS)
+        # longest prefix first, so that the most specific one wins
+        self._routes = sorted(
+            config.DEADLINE_ROUTE_MS.items(), key=lambda i: -len(i[0])
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self._exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        token = _deadline.set(loop.time() + self._get_timeout(scope))
+
+        task = asyncio.current_task()
+        watcher = _DisconnectWatcher(receive, send, task)
+        if not _has_body(scope):
+            # nothing to read, listen right away
+            watcher.start()
+        try:
+            await self.app(scope, watcher.receive, watcher.send)
+        except asyncio.CancelledError:
+            if not watcher.disconnected:
+                raise
+            # nobody is left to respond to
+            task.uncancel()
+            _DISCONNECTED.inc()
+            self.logger.info(
+                f"Cancelled {scope['method']} {scope['path']}, the client disconnected"
+            )
+        finally:
+            watcher.stop()
+            _deadline.reset(token)
+
+    def _get_timeout(self, scope: Scope) -> float:
+        timeout_ms = self.config.DEADLINE_DEFAULT_MS
+        max_ms = self.config.DEADLINE_MAX_MS
+        for prefix, route_ms in self._routes:
+            if scope["path"].startswith(prefix):
+                timeout_ms = max_ms = route_ms
+                break
+        for name, value in scope["headers"]:
+            if name == self._header:
+                try:
+                    timeout_ms = min(int(value), max_ms)
+                except ValueError:
+                    pass
+                break
+        return timeout_ms / 1000
+
+
+def _has_body(scope: Scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"transfer-encoding" or (
+            name == b"content-length" and value != b"0"
+        ):
+            return True
+    return False
+
+
+class _DisconnectWatcher:
+    """
+    Listens for the disconnection of the client, once the app has read the whole request body, and cancels the task
+    of the request when it happens before the response is complete. Messages received meanwhile are handed over to
+    the app, which may listen for the disconnection too, e.g. StreamingResponse.
+    """
+
+    def __init__(self, receive: Receive, send: Send, task: asyncio.Task) -> None:
+        super().__init__()
+        self._receive = receive
+        self._send = send
+        self._task = task
+        self._listener: asyncio.Task | None = None
+        self._messages: asyncio.Queue[Message] = asyncio.Queue()
+        self._done = False
+        self.disconnected = False
+
+    async def receive(self) -> Message:
+        if self._listener is None:
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                self.disconnected = True
+            elif not message.get("more_body", False):
+                self.start()
+            return message
+        if self._messages.empty():
+            if self.disconnected:
+                return {"type": "http.disconnect"}
+            if self._done:
+                # the response is complete, nobody listens anymore
+                return await self._receive()
+        return await self._messages.get()
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.body" and not message.get(
+            "more_body", False
+        ):
+            # a disconnection from now on is the normal end of the request
+            self.stop()
+        await self._send(message)
+
+    def start(self) -> None:
+        if self._listener is None and not self._done:
+            self._listener = asyncio.create_task(self._listen())
+
+    def stop(self) -> None:
+        self._done = True
+        if self._listener is not None:
+            self._listener.cancel()
+
+    async def _listen(self) -> None:
+        while True:
+            message = await self._receive()
+            self._messages.put_nowait(message)
+            if message["type"] == "http.disconnect":
+                break
+        self.disconnected = True
+        if not self._done:
+            self._task.cancel()
+
+
+def setup_deadline(app: fastapi.FastAPI, config: DeadlineConfig) -> None:
+    if config.DEADLINE_ENABLED:
+        app.add_middleware(DeadlineMiddleware, config=config)
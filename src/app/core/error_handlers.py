@@ -5,6 +5,9 @@ from asgi_correlation_id import correlation_id
 from asyncpg_datalayer.errors import PoolOverflowException, TooManyConnectionsException
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
+from app.core.deadline import DeadlineExceededException
+from app.core.responses import FastJSONResponse
+
 
 def setup_error_handlers(app: fastapi.FastAPI):
     _logger = logging.getLogger("app.exception")
@@ -15,7 +18,7 @@ def setup_error_handlers(app: fastapi.FastAPI):
         status_code: int,
         message: str,
         **kwargs,
-    ) -> fastapi.responses.JSONResponse:
+    ) -> FastJSONResponse:
 
         if status_code == 500:
             _logger.exception(exc)
@@ -30,11 +33,11 @@ def setup_error_handlers(app: fastapi.FastAPI):
             "request_id": request_id,
         }
         body.update(kwargs)
-        return fastapi.responses.JSONResponse(body, status_code=status_code)
+        return FastJSONResponse(body, status_code=status_code)
 
     async def _value_error_handler(
         req: fastapi.Request, exc: ValueError
-    ) -> fastapi.responses.JSONResponse:
+    ) -> FastJSONResponse:
         return await _handle_error(
             req,
             exc,
@@ -44,7 +47,7 @@ def setup_error_handlers(app: fastapi.FastAPI):
 
     async def _internal_server_error_handler(
         req: fastapi.Request, exc: Exception
-    ) -> fastapi.responses.JSONResponse:
+    ) -> FastJSONResponse:
         return await _handle_error(
             req,
             exc,
@@ -54,7 +57,7 @@ def setup_error_handlers(app: fastapi.FastAPI):
 
     async def _internal_http_exception_handler(
         req: fastapi.Request, exc: StarletteHTTPException
-    ) -> fastapi.responses.JSONResponse:
+    ) -> FastJSONResponse:
         return await _handle_error(
             req,
             exc,
@@ -64,7 +67,7 @@ def setup_error_handlers(app: fastapi.FastAPI):
 
     async def _too_many_requests_handler(
         req: fastapi.Request, exc: Exception
-    ) -> fastapi.responses.JSONResponse:
+    ) -> FastJSONResponse:
         return await _handle_error(
             req,
             exc,
@@ -72,9 +75,20 @@ def setup_error_handlers(app: fastapi.FastAPI):
             message="too many requests",
         )
 
+    async def _deadline_exceeded_handler(
+        req: fastapi.Request, exc: Exception
+    ) -> FastJSONResponse:
+        return await _handle_error(
+            req,
+            exc,
+            status_code=504,
+            message="deadline exceeded",
+        )
+
     app.add_exception_handler(ValueError, _value_error_handler)
     app.add_exception_handler(TooManyConnectionsException, _too_many_requests_handler)
     app.add_exception_handler(PoolOverflowException, _too_many_requests_handler)
+    app.add_exception_handler(DeadlineExceededException, _deadline_exceeded_handler)
     # Override starlette.exceptions.HTTPException response with our handler. Noe that fastapi.HTTPException inherits
     # from starlette.exceptions.HTTPException. See https://fastapi.tiangolo.com/tutorial/handling-errors
     app.add_exception_handler(StarletteHTTPException, _internal_http_exception_handler)
@@ -1,14 +1,27 @@
-import json
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 
+import orjson
 import pydantic_settings
 from asgi_correlation_id import CorrelationIdFilter
+from prometheus_client import Counter
+
+_DROPPED_RECORDS = Counter(
+    "app_log_records_dropped_total", "Log records dropped because the queue was full"
+)
 
 
 class LogConfig(pydantic_settings.BaseSettings):
     LOG_LEVEL: str = "INFO"
     LOG_AS_JSON: bool = False
+    # write logs from a background thread, so that a slow sink does not stall the event loop
+    LOG_ASYNC: bool = False
+    LOG_QUEUE_SIZE: int = 10000
+    # when the queue is full, drop the record (and count it) instead of blocking the caller
+    LOG_DROP_ON_FULL: bool = True
 
 
 # TODO consider refactoring, see https://github.com/mCodingLLC/VideosSampleCode/tree/master/videos/135_modern_logging
@@ -21,26 +34,66 @@ _FORMATTER = logging.Formatter()
 
 
 def _log_record_to_json(record: logging.LogRecord) -> dict:
-    _message = record.getMessage()
-    return {
-        k: v
-        for k, v in {
-            "level": record.levelname,
-            "name": record.name,
-            "module": record.module,
-            "func": record.funcName,
-            "line": record.lineno,
-            "message": _message,
-            "exc_info": (
-                _FORMATTER.formatException(record.exc_info) if record.exc_info else None
-            ),
-            "stack_info": record.stack_info,
-            "request_id": (
-                record.correlation_id if hasattr(record, "correlation_id") else None
-            ),
-        }.items()
-        if v
+    data = {
+        "level": record.levelname,
+        "name": record.name,
+        "module": record.module,
+        "func": record.funcName,
+        "line": record.lineno,
+        "message": record.getMessage(),
     }
+    if record.exc_info:
+        data["exc_info"] = _FORMATTER.formatException(record.exc_info)
+    elif record.exc_text:
+        # already formatted by _QueueHandler.prepare
+        data["exc_info"] = record.exc_text
+    if record.stack_info:
+        data["stack_info"] = record.stack_info
+    request_id = getattr(record, "correlation_id", None)
+    if request_id:
+        data["request_id"] = request_id
+    # structured fields, passed as logger.info(..., extra={"data": {...}})
+    extra = getattr(record, "data", None)
+    if extra:
+        data["data"] = extra
+    return {k: v for k, v in data.items() if v}
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return orjson.dumps(_log_record_to_json(record)).decode()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records over to a QueueListener. Unlike the default QueueHandler it does not format records on the caller
+    thread, it only resolves what cannot be resolved later (message args and exception), and it drops records when
+    the queue is full if so configured.
+    """
+
+    def __init__(self, q: queue.Queue, drop_on_full: bool) -> None:
+        super().__init__(q)
+        self.drop_on_full = drop_on_full
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _FORMATTER.formatException(record.exc_info)
+            # tracebacks keep frames alive, do not pass them to the other thread
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if not self.drop_on_full:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DROPPED_RECORDS.inc()
 
 
 def _build_handler():
@@ -50,15 +103,22 @@ def _build_handler():
 
 
 def _build_json_handler():
-    class _JsonFormatter(logging.Formatter):
-        def format(self, record: logging.LogRecord) -> str:
-            return json.dumps(_log_record_to_json(record))
-
     _handler = logging.StreamHandler(sys.stdout)
     _handler.setFormatter(_JsonFormatter())
     return _handler
 
 
+def _build_queue_handler(handler: logging.Handler, config: LogConfig):
+    _queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(
+        _queue, handler, respect_handler_level=True
+    )
+    _listener.start()
+    # flush the queue on exit
+    atexit.register(_listener.stop)
+    return _QueueHandler(_queue, drop_on_full=config.LOG_DROP_ON_FULL)
+
+
 def _setup_logging(config: LogConfig):
     log_level = config.LOG_LEVEL
     log_as_json = config.LOG_AS_JSON
@@ -69,6 +129,9 @@ def _setup_logging(config: LogConfig):
 
     # re-configure root logger handler
     _handler = _build_json_handler() if log_as_json else _build_handler()
+    if config.LOG_ASYNC:
+        _handler = _build_queue_handler(_handler, config)
+    # the filter runs on the caller thread, where the correlation id is set
     _handler.addFilter(CorrelationIdFilter())
     logging.root.addHandler(_handler)
 
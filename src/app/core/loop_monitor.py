@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+import pydantic_settings
+from asgi_correlation_id import correlation_id
+from prometheus_client import Counter, Histogram
+
+_LAG_SECONDS = Histogram(
+    "app_event_loop_lag_seconds",
+    "How late the event loop runs a callback that is due, i.e. how long other callbacks held it",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+_BLOCKED = Counter(
+    "app_event_loop_blocked_total",
+    "Callbacks that blocked the event loop longer than LOOP_MONITOR_BLOCKED_MS",
+)
+
+
+class LoopMonitorConfig(pydantic_settings.BaseSettings):
+    LOOP_MONITOR_ENABLED: bool = True
+    # how often the lag is sampled
+    LOOP_MONITOR_INTERVAL_MS: int = 100
+    # callbacks blocking the loop longer are reported, with their stack
+    LOOP_MONITOR_BLOCKED_MS: int = 250
+
+
+class LoopMonitor:
+    """
+    Samples the scheduling lag of the event loop: a timer firing late means that the loop was busy running something
+    else, e.g. validating or encoding a large response, or writing logs synchronously. Also runs a watchdog thread,
+    which reports a callback blocking the loop while it still blocks, with the stack of the loop thread and the
+    request id of the task running, so that a blocked loop can be told apart from a slow DB.
+    """
+
+    def __init__(self, config: LoopMonitorConfig) -> None:
+        super().__init__()
+        self.logger = logging.getLogger(f"{self.__module__}.{type(self).__name__}")
+        self.config = config
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        # time (time.monotonic) and number of the last samples, written by the loop, read by the watchdog
+        self._beat = 0.0
+        self._beats = 0
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopping = threading.Event()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+        self._thread = threading.Thread(
+            target=self._watch, name="LoopWatchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _run(self) -> None:
+        interval = self.config.LOOP_MONITOR_INTERVAL_MS / 1000
+        while True:
+            start = self._loop.time()
+            await asyncio.sleep(interval)
+            _LAG_SECONDS.observe(max(0.0, self._loop.time() - start - interval))
+            self._beat = time.monotonic()
+            self._beats += 1
+
+    def _watch(self) -> None:
+        interval = self.config.LOOP_MONITOR_INTERVAL_MS / 1000
+        threshold = self.config.LOOP_MONITOR_BLOCKED_MS / 1000
+        reported = None
+        while not self._stopping.wait(threshold / 2):
+            beats, beat = self._beats, self._beat
+            # how late the next sample is
+            blocked = time.monotonic() - beat - interval
+            if blocked > threshold and beats != reported:
+                # once per blocking callback
+                reported = beats
+                _BLOCKED.inc()
+                self._report(blocked)
+
+    def _report(self, blocked: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        task = asyncio.current_task(self._loop)
+        task_name = task.get_name() if task is not None else None
+        request_id = (
+            task.get_context().get(correlation_id) if task is not None else None
+        )
+        # logged with the request id of the blocking task, instead of the one of this thread (none)
+        token = correlation_id.set(request_id)
+        try:
+            self.logger.warning(
+                f"Event loop blocked for more than {int(blocked * 1000)} ms, by {task_name}:\n{stack}",
+                extra={
+                    "data": {
+                        "blocked_ms": int(blocked * 1000),
+                        "task": task_name,
+                        "request_id": request_id,
+                    }
+                },
+            )
+        finally:
+            correlation_id.reset(token)
+
+
+def create_loop_monitor(config: LoopMonitorConfig) -> LoopMonitor | None:
+    if not config.LOOP_MONITOR_ENABLED:
+        return None
+    return LoopMonitor(config)
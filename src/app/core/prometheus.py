@@ -1,6 +1,17 @@
+import os
+
 import fastapi
+from prometheus_client import multiprocess
 from prometheus_fastapi_instrumentator import Instrumentator
 
 
 def setup_prometheus(app: fastapi.FastAPI):
-    Instrumentator().instrument(app).expose(app)
+    # only the /metrics endpoint, the request metrics are recorded by RequestMiddleware, the event loop metrics by
+    # LoopMonitor
+    Instrumentator().expose(app)
+
+
+def teardown_prometheus():
+    # In multiprocess mode (see app.serve), drop the live gauges of this worker from the aggregation.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,156 @@
+import contextvars
+import time
+from uuid import uuid4
+
+import fastapi
+from asgi_correlation_id import correlation_id
+from prometheus_client import Counter, Histogram, Summary
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# same names, labels and buckets as the default metrics of prometheus-fastapi-instrumentator, which this replaces
+_REQUESTS = Counter(
+    "http_requests_total",
+    "Total number of requests by method, status and handler.",
+    ["method", "status", "handler"],
+)
+# bytes of the bodies actually received and sent, also without a Content-Length, e.g. streamed
+_REQUEST_SIZE = Summary(
+    "http_request_size_bytes",
+    "Content length of incoming requests by handler.",
+    ["handler"],
+)
+_RESPONSE_SIZE = Summary(
+    "http_response_size_bytes",
+    "Content length of outgoing responses by handler.",
+    ["handler"],
+)
+_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Latency by method and handler, with few buckets",
+    ["method", "handler"],
+    buckets=(0.1, 0.5, 1),
+)
+_DURATION_HIGHR = Histogram(
+    "http_request_duration_highr_seconds",
+    "Latency with many buckets but no labels, for more accurate percentiles",
+    buckets=(
+        0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5, 7.5, 10, 30, 60,
+    ),
+)  # fmt: skip
+
+# objects living as long as the current request, see get_request_state
+_request_state: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "request_state", default=None
+)
+
+_HEADER_NAME = b"x-request-id"
+_STATUS_GROUPS = {i: f"{i}xx" for i in range(1, 6)}
+
+
+def get_request_state() -> dict | None:
+    """
+    Storage for the objects scoped to the current request, e.g. memos, None outside of a request. Lets app-scoped
+    services keep per-request state without being built per request.
+    """
+    return _request_state.get()
+
+
+class RequestMiddleware:
+    """
+    Handles what every request needs in a single layer: the request id (X-Request-ID, taken from the request or
+    generated, and sent back with the response), the request state (see get_request_state), the timing and the request
+    metrics. The request id is set once in the correlation_id contextvar, where logs, error handlers and admission
+    control read it from. Neither is reset, so that the 500 error handler, which runs outside the middlewares, still
+    sees them, every request runs in its own task and context anyway.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        super().__init__()
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == _HEADER_NAME:
+                request_id = value.decode("latin-1")
+                break
+        if not request_id:
+            request_id = uuid4().hex
+            # handlers reading the request headers see the generated id too
+            scope["headers"] = [
+                *(h for h in scope["headers"] if h[0] != _HEADER_NAME),
+                (_HEADER_NAME, request_id.encode("latin-1")),
+            ]
+        correlation_id.set(request_id)
+        _request_state.set({})
+
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cycle = _RequestCycle(receive, send, request_id.encode("latin-1"))
+        try:
+            await self.app(scope, cycle.receive, cycle.send)
+        finally:
+            cycle.observe(scope)
+
+
+class _RequestCycle:
+    __slots__ = (
+        "_receive",
+        "_send",
+        "_request_id",
+        "_start",
+        "status",
+        "request_size",
+        "response_size",
+    )
+
+    def __init__(self, receive: Receive, send: Send, request_id: bytes) -> None:
+        super().__init__()
+        self._receive = receive
+        self._send = send
+        self._request_id = request_id
+        self._start = time.perf_counter()
+        # what the response will be when the app raises, see ServerErrorMiddleware
+        self.status = 500
+        self.request_size = 0
+        self.response_size = 0
+
+    async def receive(self) -> Message:
+        message = await self._receive()
+        if message["type"] == "http.request":
+            self.request_size += len(message.get("body", b""))
+        return message
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            message["headers"] = [
+                *message["headers"],
+                (_HEADER_NAME, self._request_id),
+            ]
+        elif message["type"] == "http.response.body":
+            self.response_size += len(message.get("body", b""))
+        await self._send(message)
+
+    def observe(self, scope: Scope) -> None:
+        elapsed = time.perf_counter() - self._start
+        # set by the matching FastAPI route, requests matching no route are grouped under "none"
+        route = scope.get("route")
+        handler = getattr(route, "path_format", None) or "none"
+        method = scope["method"]
+        status = _STATUS_GROUPS.get(self.status // 100) or str(self.status)
+        _REQUESTS.labels(method, status, handler).inc()
+        _DURATION.labels(method, handler).observe(elapsed)
+        _DURATION_HIGHR.observe(elapsed)
+        _REQUEST_SIZE.labels(handler).observe(self.request_size)
+        _RESPONSE_SIZE.labels(handler).observe(self.response_size)
+
+
+def setup_request_middleware(app: fastapi.FastAPI) -> None:
+    app.add_middleware(RequestMiddleware)
@@ -0,0 +1,18 @@
+import typing
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded with orjson, which serializes UUID and datetime natively. The output is the same as
+    JSONResponse (compact, UTF-8, ISO 8601 datetimes): types orjson does not know, e.g. Decimal, fall back to
+    jsonable_encoder.
+    """
+
+    def render(self, content: typing.Any) -> bytes:
+        return orjson.dumps(
+            content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS
+        )
@@ -0,0 +1,39 @@
+import contextlib
+import time
+import typing
+
+from prometheus_client import Gauge
+
+_STARTUP_PHASE_SECONDS = Gauge(
+    "app_startup_phase_seconds",
+    "Duration of the startup phases of the last start",
+    ["phase"],
+    multiprocess_mode="max",
+)
+
+
+class StartupTimer:
+    """
+    Times the phases of the startup, to log them and export them as metrics.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.phases: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = elapsed
+            _STARTUP_PHASE_SECONDS.labels(name).set(elapsed)
+
+    def to_dict(self) -> dict[str, int]:
+        # in milliseconds
+        return {name: int(elapsed * 1000) for name, elapsed in self.phases.items()}
+
+    def __str__(self) -> str:
+        return ", ".join(f"{name} {ms} ms" for name, ms in self.to_dict().items())
@@ -0,0 +1,12 @@
+import asyncpg
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def get_asyncpg_connection(session: AsyncSession) -> asyncpg.Connection:
+    """
+    Returns the asyncpg connection underlying the session, for the features SQLAlchemy does not expose (server-side
+    cursors, COPY). The connection stays owned by the session, do not close it.
+    """
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    return raw_connection.driver_connection
@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import typing
+
+from asgi_correlation_id import correlation_id
+from prometheus_client import Histogram
+
+from app.core.request_middleware import get_request_state
+
+from .routing import is_pinned_to_primary, pin_to_primary
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+_BATCH_SIZE = Histogram(
+    "app_batch_loader_batch_size",
+    "Keys loaded together by a BatchLoader",
+    ["loader"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+
+class BatchLoader(typing.Generic[K, V]):
+    """
+    Collects the keys requested within the same event loop iteration (or within `window` seconds) and loads them
+    with a single call of `load_many`, which returns the values found by key. Meant to be shared by all requests, so
+    that concurrent lookups by key become a single query on a single connection. A batch runs with the request id of
+    the request that started it, and reads from the primary when any of its callers is pinned to it (see
+    pin_to_primary), so that it reads their own writes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        load_many: typing.Callable[[list[K]], typing.Awaitable[dict[K, V]]],
+        max_batch_size: int = 500,
+        window: float = 0.0,
+    ) -> None:
+        super().__init__()
+        self.name = name
+        self.load_many = load_many
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._pending: dict[K, asyncio.Future] = {}
+        # of the pending batch
+        self._request_id: str | None = None
+        self._pinned_to_primary = False
+        self._handle: asyncio.Handle | None = None
+        # keep a reference to the running loads, see asyncio.create_task
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, key: K) -> V | None:
+        if is_pinned_to_primary():
+            self._pinned_to_primary = True
+        future = self._pending.get(key)
+        if future is None:
+            if not self._pending:
+                self._request_id = correlation_id.get()
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._dispatch()
+            elif self._handle is None:
+                if self.window:
+                    self._handle = loop.call_later(self.window, self._dispatch)
+                else:
+                    self._handle = loop.call_soon(self._dispatch)
+        # shield: a cancelled caller must not cancel the load shared with the others
+        return await asyncio.shield(future)
+
+    def clear(self) -> None:
+        # nothing is kept once a batch is loaded, see MemoizedLoader
+        pass
+
+    def memoized(self) -> "MemoizedLoader[K, V]":
+        return MemoizedLoader(self)
+
+    def request_scoped(self) -> "RequestScopedLoader[K, V]":
+        return RequestScopedLoader(self)
+
+    def _dispatch(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        batch, self._pending = self._pending, {}
+        request_id, self._request_id = self._request_id, None
+        pinned, self._pinned_to_primary = self._pinned_to_primary, False
+        if batch:
+            # In a new context: the batch serves many requests, it must not run with the deadline of the one that
+            # happened to start it. Only its request id is kept, for the logs, and the replica pin of any caller.
+            context = contextvars.Context()
+            context.run(_init_batch_context, request_id, pinned)
+            task = asyncio.create_task(self._load(batch), context=context)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, batch: dict[K, asyncio.Future]) -> None:
+        _BATCH_SIZE.labels(self.name).observe(len(batch))
+        try:
+            values = await self.load_many(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+                    # mark the exception as retrieved, in case the caller is gone
+                    future.exception()
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(values.get(key))
+
+
+def _init_batch_context(request_id: str | None, pinned_to_primary: bool) -> None:
+    correlation_id.set(request_id)
+    if pinned_to_primary:
+        pin_to_primary()
+
+
+class MemoizedLoader(typing.Generic[K, V]):
+    """
+    Remembers what was loaded through a BatchLoader, for the lifetime of a request.
+    """
+
+    def __init__(self, loader: BatchLoader[K, V]) -> None:
+        super().__init__()
+        self.loader = loader
+        self._memo: dict[K, V | None] = {}
+
+    async def load(self, key: K) -> V | None:
+        if key in self._memo:
+            return self._memo[key]
+        value = await self.loader.load(key)
+        self._memo[key] = value
+        return value
+
+    def clear(self) -> None:
+        self._memo.clear()
+
+
+class RequestScopedLoader(typing.Generic[K, V]):
+    """
+    Loads through a MemoizedLoader of the current request (see get_request_state), created on first use. Can be built
+    once and shared, e.g. by an app-scoped repository. Outside of a request, loads through the BatchLoader.
+    """
+
+    def __init__(self, loader: BatchLoader[K, V]) -> None:
+        super().__init__()
+        self.loader = loader
+
+    async def load(self, key: K) -> V | None:
+        return await self._get_loader().load(key)
+
+    def clear(self) -> None:
+        self._get_loader().clear()
+
+    def _get_loader(self) -> BatchLoader[K, V] | MemoizedLoader[K, V]:
+        state = get_request_state()
+        if state is None:
+            return self.loader
+        memoized = state.get(self)
+        if memoized is None:
+            memoized = state[self] = self.loader.memoized()
+        return memoized
@@ -0,0 +1,252 @@
+import asyncio
+import contextlib
+import json
+import logging
+import typing
+import uuid
+
+import asyncpg
+import pydantic_settings
+from asyncpg_datalayer.db import DB
+from prometheus_client import Counter, Gauge
+
+# see the migration v007-table-change-notify
+_CHANNEL = "table_changes"
+
+_EVENTS = Counter(
+    "app_change_feed_events_total", "Change notifications received", ["table", "op"]
+)
+_RESYNCS = Counter(
+    "app_change_feed_resyncs_total",
+    "Resyncs published, after which subscribers must assume anything changed",
+    ["reason"],
+)
+_CONNECTED = Gauge(
+    "app_change_feed_connected",
+    "Whether the change feed is listening",
+    multiprocess_mode="min",
+)
+
+
+class ChangeFeedConfig(pydantic_settings.BaseSettings):
+    CHANGE_FEED_ENABLED: bool = True
+    # delay before reconnecting, doubled after every failed attempt up to the max
+    CHANGE_FEED_RECONNECT_SECONDS: float = 0.5
+    CHANGE_FEED_RECONNECT_MAX_SECONDS: float = 30.0
+    # the listening connection is idle, it is checked at this interval to notice when it is lost
+    CHANGE_FEED_PING_SECONDS: float = 10.0
+    # events buffered per subscription, a subscriber falling further behind gets a resync instead
+    CHANGE_FEED_QUEUE_SIZE: int = 1000
+
+
+class ChangeEvent(typing.NamedTuple):
+    # None for a resync of all the tables
+    table: str | None
+    # insert, update, delete, truncate, or resync
+    op: str
+    # version of the table after the change, see UsersRepository.get_version
+    version: int | None = None
+    # ids of the rows changed, None when unknown, i.e. any row may have changed
+    ids: tuple[uuid.UUID, ...] | None = None
+
+    def to_json(self) -> dict:
+        return {
+            "table": self.table,
+            "op": self.op,
+            "version": self.version,
+            "ids": [str(i) for i in self.ids] if self.ids is not None else None,
+        }
+
+
+def _resync(table: str | None = None) -> ChangeEvent:
+    return ChangeEvent(table, "resync")
+
+
+class ChangeSubscription:
+    """
+    Events of a ChangeFeed, in the order they were committed, see ChangeFeed.subscribe.
+    """
+
+    def __init__(self, tables: typing.Collection[str] | None, max_size: int) -> None:
+        super().__init__()
+        self.tables = tables
+        self._queue: asyncio.Queue[ChangeEvent] = asyncio.Queue(max_size)
+
+    def publish(self, event: ChangeEvent) -> None:
+        if event.table is not None and self.tables is not None:
+            if event.table not in self.tables:
+                return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # never block the feed on a slow subscriber: its backlog is replaced by a resync
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(_resync())
+            _RESYNCS.labels("overflow").inc()
+
+    async def get(self) -> ChangeEvent:
+        return await self._queue.get()
+
+    def __aiter__(self) -> "ChangeSubscription":
+        return self
+
+    async def __anext__(self) -> ChangeEvent:
+        return await self.get()
+
+
+class ChangeFeed:
+    """
+    Changes of the tables, committed by any process, as notified by their triggers (see the migration
+    v007-table-change-notify). Listens on a dedicated connection outside the pool, and fans the events out to the
+    listeners (e.g. cache invalidation) and the subscriptions of this process. Notifications sent while not listening
+    are lost, so after every reconnection, and whenever the versions of a table skip one, a resync event tells
+    everyone that anything may have changed.
+    """
+
+    def __init__(self, db: DB, config: ChangeFeedConfig) -> None:
+        super().__init__()
+        self.logger = logging.getLogger(f"{self.__module__}.{type(self).__name__}")
+        self.db = db
+        self.config = config
+        self.is_connected = False
+        # last version seen per table
+        self._versions: dict[str, int] = {}
+        self._listeners: list[
+            typing.Callable[[ChangeEvent], typing.Awaitable[None]]
+        ] = []
+        self._subscriptions: set[ChangeSubscription] = set()
+        self._pending: asyncio.Queue[ChangeEvent] = asyncio.Queue()
+        self._connected = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def add_listener(
+        self, listener: typing.Callable[[ChangeEvent], typing.Awaitable[None]]
+    ) -> None:
+        """
+        The listeners are awaited one event at a time, in order, they should be quick.
+        """
+        self._listeners.append(listener)
+
+    @contextlib.contextmanager
+    def subscribe(
+        self, tables: typing.Collection[str] | None = None
+    ) -> typing.Iterator[ChangeSubscription]:
+        subscription = ChangeSubscription(tables, self.config.CHANGE_FEED_QUEUE_SIZE)
+        self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions.discard(subscription)
+
+    def get_version(self, table: str) -> int | None:
+        return self._versions.get(table)
+
+    async def start(self, timeout: float | None = None) -> None:
+        """
+        Starts listening in the background, waiting up to `timeout` seconds for the first connection.
+        """
+        self._tasks = [
+            asyncio.create_task(self._run()),
+            asyncio.create_task(self._dispatch()),
+        ]
+        if timeout is not None:
+            try:
+                await asyncio.wait_for(self._connected.wait(), timeout)
+            except TimeoutError:
+                self.logger.warning("Change feed not connected yet")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _run(self) -> None:
+        delay = self.config.CHANGE_FEED_RECONNECT_SECONDS
+        while True:
+            try:
+                await self._listen()
+            except Exception as e:
+                self.logger.error(f"Change feed connection failed: {e}")
+            if self.is_connected:
+                delay = self.config.CHANGE_FEED_RECONNECT_SECONDS
+            self._set_connected(False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.config.CHANGE_FEED_RECONNECT_MAX_SECONDS)
+
+    async def _listen(self) -> None:
+        timeout = self.config.CHANGE_FEED_PING_SECONDS
+        conn = await asyncpg.connect(self.db.postgres_url, timeout=timeout)
+        try:
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda _: lost.set())
+            await conn.add_listener(_CHANNEL, self._on_notification)
+            # listening already, so any change committed after these versions is notified
+            rows = await conn.fetch("SELECT table_name, version FROM table_versions")
+            self._versions = {r["table_name"]: r["version"] for r in rows}
+            if self._connected.is_set():
+                # changes committed while not listening were missed
+                self._publish(_resync())
+                _RESYNCS.labels("reconnect").inc()
+            self._set_connected(True)
+            self.logger.info("Change feed listening")
+            while not lost.is_set():
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(lost.wait(), timeout)
+                if not lost.is_set():
+                    await conn.fetchval("SELECT 1", timeout=timeout)
+            self.logger.error("Change feed connection lost")
+        finally:
+            conn.terminate()
+
+    def _set_connected(self, connected: bool) -> None:
+        self.is_connected = connected
+        if connected:
+            self._connected.set()
+        _CONNECTED.set(1 if connected else 0)
+
+    def _on_notification(
+        self, conn: asyncpg.Connection, pid: int, channel: str, payload: str
+    ) -> None:
+        data = json.loads(payload)
+        table, version = data["table"], data["version"]
+        last = self._versions.get(table)
+        if last is not None and version <= last:
+            # committed before the versions were read
+            return
+        self._versions[table] = version
+        if last is not None and version > last + 1:
+            # changes without notification, e.g. written with the triggers disabled
+            self._publish(_resync(table))
+            _RESYNCS.labels("gap").inc()
+        ids = data["ids"]
+        if ids is not None:
+            ids = tuple(uuid.UUID(i) for i in ids)
+        _EVENTS.labels(table, data["op"]).inc()
+        self._publish(ChangeEvent(table, data["op"], version, ids))
+
+    def _publish(self, event: ChangeEvent) -> None:
+        for subscription in self._subscriptions:
+            subscription.publish(event)
+        if self._listeners:
+            self._pending.put_nowait(event)
+
+    async def _dispatch(self) -> None:
+        while True:
+            event = await self._pending.get()
+            for listener in self._listeners:
+                try:
+                    await listener(event)
+                except Exception as e:
+                    self.logger.exception(e)
+
+
+def create_change_feed(db: DB, config: ChangeFeedConfig) -> ChangeFeed | None:
+    if not config.CHANGE_FEED_ENABLED:
+        return None
+    return ChangeFeed(db, config)
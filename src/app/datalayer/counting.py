@@ -0,0 +1,92 @@
+import enum
+import json
+import typing
+
+import pydantic_settings
+import sqlalchemy
+from asyncpg_datalayer.db import DB
+
+from .asyncpg_utils import get_asyncpg_connection
+
+
+class CountStrategy(enum.StrEnum):
+    # COUNT(*), exact but proportional to the rows counted
+    EXACT = "exact"
+    # the estimate of the query planner, from the table statistics (pg_class.reltuples), no row is read
+    ESTIMATE = "estimate"
+    # the row count kept by triggers, see the migration v006-table-row-counts. Exact, but counts the whole table only,
+    # filtered counts fall back to ESTIMATE
+    COUNTER = "counter"
+
+
+class CountConfig(pydantic_settings.BaseSettings):
+    # how the listings count their total, "none" not to count at all
+    COUNT_STRATEGY: CountStrategy | typing.Literal["none"] = CountStrategy.COUNTER
+
+
+class RowCount(typing.NamedTuple):
+    total: int
+    is_estimate: bool
+
+
+class CountingMixin:
+    """
+    Counts the rows of a BaseRepository table, with the given CountStrategy.
+    """
+
+    db: DB
+    record_cls: type
+
+    async def count_rows(
+        self,
+        strategy: CountStrategy,
+        where: typing.Sequence[sqlalchemy.ColumnElement[bool]] = (),
+        row_counter: int | None = None,
+    ) -> RowCount:
+        if strategy == CountStrategy.COUNTER and not where:
+            # the counter already read by the caller, if any
+            total = row_counter
+            if total is None:
+                total = await self._get_row_counter()
+            if total is not None:
+                return RowCount(total, is_estimate=False)
+        if strategy == CountStrategy.EXACT:
+            query = (
+                sqlalchemy.select(sqlalchemy.func.count())
+                .select_from(self.record_cls)
+                .where(*where)
+            )
+            async with self.db.get_session(readonly=True) as session:
+                response = await session.execute(query)
+                return RowCount(response.scalar_one(), is_estimate=False)
+        return RowCount(await self._estimate_rows(where), is_estimate=True)
+
+    async def _get_row_counter(self) -> int | None:
+        # None when the table has no counter triggers
+        query = sqlalchemy.text(
+            "SELECT row_count FROM table_versions WHERE table_name = :table_name"
+        ).bindparams(table_name=self.record_cls.__tablename__)
+        async with self.db.get_session(readonly=True) as session:
+            response = await session.execute(query)
+            return response.scalar_one_or_none()
+
+    async def _estimate_rows(
+        self,
+        where: typing.Sequence[sqlalchemy.ColumnElement[bool]],
+    ) -> int:
+        """
+        Rows the planner expects the query to return, which it derives from reltuples and the current size of the
+        table, and from the column statistics for the filters. Costs the planning of the query only.
+        """
+        query = sqlalchemy.select(sqlalchemy.literal(1)).select_from(self.record_cls)
+        compiled = query.where(*where).compile(dialect=self.db.engine.dialect)
+        params = [compiled.params[k] for k in compiled.positiontup]
+        async with self.db.get_session(readonly=True) as session:
+            conn = await get_asyncpg_connection(session)
+            plan = await conn.fetchval(
+                f"EXPLAIN (FORMAT JSON) {compiled.string}", *params
+            )
+        # decoded already when the connection has a json codec, like the connections of the engine
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
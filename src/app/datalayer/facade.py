@@ -1,34 +1,22 @@
-import sys
-
-import fastapi
 from asyncpg_datalayer.db import DB
 
-from .users import UsersRepository
-
+from app.core.cache import Cache
 
-def get_db(request: fastapi.Request) -> DB:
-    if not hasattr(request.app.state, "db"):
-        message = """DB not found in app.state.
-        Make sure to initialize the DB in your FastAPI app like this:
-
-        ```
-        import os
-        import fastapi
-        from asyncpg_datalayer.db_factory import create_db
-
-        app = fastapi.FastAPI()
-        app.state.db = create_db()
-        ```
-        """
-        print(message, file=sys.stderr)
-        raise RuntimeError("DB not found in app.state")
-    return request.app.state.db
+from .batch_loader import BatchLoader, MemoizedLoader, RequestScopedLoader
+from .users import UsersRepository
 
 
 class DatalayerFacade:
-    def __init__(self, db: DB = fastapi.Depends(get_db)) -> None:
+    def __init__(
+        self,
+        db: DB,
+        # None (no cache) when the facade is built outside of the app, e.g. create_some_data
+        cache: Cache | None = None,
+        user_loader: BatchLoader | MemoizedLoader | RequestScopedLoader | None = None,
+    ) -> None:
         super().__init__()
         self.db = db
-        self.users = UsersRepository(db)
+        self.cache = cache
+        self.users = UsersRepository(db, cache, user_loader)
 
     ### custom methods go below ###
@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import re
+import time
+import typing
+
+import asyncpg
+import pydantic_settings
+import sqlalchemy
+from asyncpg_datalayer.db import DB, get_asyncpg_cause
+from prometheus_client import Histogram
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.deadline import DeadlineExceededException, get_remaining_time
+
+_QUERY_SECONDS = Histogram(
+    "app_db_query_seconds",
+    "Duration of the SQL statements, by statement fingerprint (verb and table)",
+    ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+_POOL_ACQUIRE_SECONDS = Histogram(
+    "app_db_pool_acquire_seconds",
+    "Time spent waiting for a connection from the pool, pre-ping included",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+_VERB = re.compile(r"\s*(\w+)")
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+\"?([\w.]+)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_slow_query_logger = logging.getLogger("app.sql.slow")
+
+
+class SqlConfig(pydantic_settings.BaseSettings):
+    # statements taking longer are logged, with their request id
+    SQL_SLOW_QUERY_MS: int = 500
+
+
+@functools.lru_cache(maxsize=1024)
+def get_fingerprint(statement: str) -> str:
+    """
+    Low cardinality name of a statement, e.g. "SELECT users", to label metrics with.
+    """
+    verb = _VERB.match(statement)
+    table = _TABLE.search(statement)
+    parts = [verb.group(1).upper() if verb else "UNKNOWN"]
+    if table:
+        parts.append(table.group(1))
+    return " ".join(parts)
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_statement(statement: str) -> str:
+    # parameters are bound separately ($1, $2, ...), only whitespace varies
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def instrument_engine(engine: sqlalchemy.Engine, slow_query_seconds: float) -> None:
+    """
+    Times every statement executed through SQLAlchemy. Statements executed on the raw asyncpg connection (e.g. COPY)
+    are not seen.
+    """
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        context.app_query_start = time.perf_counter()
+
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - context.app_query_start
+        fingerprint = get_fingerprint(statement)
+        _QUERY_SECONDS.labels(fingerprint).observe(elapsed)
+        if elapsed >= slow_query_seconds:
+            _slow_query_logger.warning(
+                f"Slow query {fingerprint} took {int(elapsed * 1000)} ms",
+                extra={
+                    "data": {
+                        "elapsed_ms": round(elapsed * 1000, 3),
+                        "fingerprint": fingerprint,
+                        "statement": normalize_statement(statement),
+                    }
+                },
+            )
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    sqlalchemy.event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class InstrumentedDB(DB):
+    """
+    DB reporting the duration of its statements and of the pool checkouts, see instrument_engine. Within a request
+    with a deadline (see DeadlineMiddleware), the pool checkout and the statements of the session are bounded by the
+    time left, statements through SET LOCAL statement_timeout, and DeadlineExceededException is raised when it runs
+    out.
+    """
+
+    def __init__(
+        self,
+        postgres_url: str,
+        slow_query_ms: int = 500,
+        **kwargs,
+    ) -> None:
+        super().__init__(postgres_url, **kwargs)
+        self.slow_query_ms = slow_query_ms
+        instrument_engine(self.engine.sync_engine, slow_query_ms / 1000)
+
+    @contextlib.asynccontextmanager
+    async def get_session(
+        self,
+        reuse_session: AsyncSession = None,
+        readonly: bool | None = None,
+    ) -> typing.AsyncIterator[AsyncSession]:
+        remaining = get_remaining_time() if reuse_session is None else None
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceededException("deadline exceeded")
+        async with super().get_session(reuse_session, readonly) as session:
+            if reuse_session is None:
+                # sessions connect lazily, connect now to time the checkout on its own
+                start = time.perf_counter()
+                async with asyncio.timeout(remaining):
+                    await session.connection()
+                _POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+                if remaining is not None:
+                    # the deadline is enforced by the server: the statement is cancelled there, not just abandoned
+                    await self._set_statement_timeout(session, start + remaining)
+            yield session
+
+    @staticmethod
+    async def _set_statement_timeout(session: AsyncSession, deadline: float) -> None:
+        # until the end of the transaction of the session, at least 1 ms as 0 means no timeout
+        timeout_ms = max(1, int((deadline - time.perf_counter()) * 1000))
+        await session.execute(
+            sqlalchemy.text(f"SET LOCAL statement_timeout = {timeout_ms}")
+        )
+
+    def _map_error(self, err: Exception) -> Exception:
+        if get_remaining_time() is not None:
+            # TimeoutError from the checkout, QueryCanceledError from statement_timeout
+            cause = get_asyncpg_cause(err)
+            if isinstance(err, TimeoutError) or isinstance(
+                cause, asyncpg.QueryCanceledError
+            ):
+                self.logger.warning(f"Deadline exceeded: {cause}")
+                return DeadlineExceededException("deadline exceeded")
+        return super()._map_error(err)
@@ -0,0 +1,234 @@
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import os
+import typing
+
+import asyncpg
+import pydantic_settings
+from asyncpg_datalayer.db import DB
+from asyncpg_datalayer.db_factory import create_db
+from prometheus_client import Counter, Gauge
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .instrumentation import InstrumentedDB, SqlConfig
+
+_REPLICA_LAG_SECONDS = Gauge(
+    "app_db_replica_lag_seconds",
+    "Replication lag of the read replicas, -1 when unknown",
+    ["replica"],
+    multiprocess_mode="max",
+)
+_READS = Counter(
+    "app_db_readonly_sessions_total", "Readonly sessions by target", ["target"]
+)
+
+# lag of a standby that has replayed everything it received, or of a server that is not a standby at all
+_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# set once the current request has written to the primary, see ReadYourWritesMiddleware
+_pinned_to_primary: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "pinned_to_primary", default=False
+)
+
+
+class ReplicaConfig(pydantic_settings.BaseSettings):
+    POSTGRES_REPLICA_URLS: list[str] = []
+    # replicas lagging behind more than this are not read from
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_LAG_CHECK_INTERVAL_SECONDS: float = 1.0
+    REPLICA_LAG_CHECK_TIMEOUT_SECONDS: float = 2.0
+
+
+def pin_to_primary() -> None:
+    """
+    Sends the following readonly sessions of the current request to the primary. Happens automatically after a
+    write session, so that a request reads its own writes.
+    """
+    _pinned_to_primary.set(True)
+
+
+def is_pinned_to_primary() -> bool:
+    return _pinned_to_primary.get()
+
+
+@contextlib.contextmanager
+def read_from_primary() -> typing.Iterator[None]:
+    """
+    Sends the readonly sessions opened within to the primary, e.g. for reads shared by many requests, which cannot
+    tell whether any of them must read its own writes.
+    """
+    token = _pinned_to_primary.set(True)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+class Replica:
+    def __init__(self, name: str, db: DB) -> None:
+        super().__init__()
+        self.name = name
+        self.db = db
+        self.lag: float | None = None
+        self._conn: asyncpg.Connection | None = None
+
+    async def check_lag(self, timeout: float) -> float | None:
+        try:
+            if self._conn is None or self._conn.is_closed():
+                self._conn = await asyncpg.connect(
+                    self.db.postgres_url, timeout=timeout
+                )
+            lag = await self._conn.fetchval(_LAG_QUERY, timeout=timeout)
+            self.lag = float(lag) if lag is not None else None
+        except Exception:
+            self.lag = None
+            await self.close()
+            raise
+        finally:
+            _REPLICA_LAG_SECONDS.labels(self.name).set(
+                self.lag if self.lag is not None else -1
+            )
+        return self.lag
+
+    async def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.terminate()
+
+
+class RoutingDB(InstrumentedDB):
+    """
+    The primary DB, which sends readonly sessions to the read replicas, round-robin. Replicas whose replication lag
+    is unknown or above REPLICA_MAX_LAG_SECONDS are skipped, and reads fall back to the primary when none is left.
+    Lag is polled in the background, between start() and stop().
+    """
+
+    def __init__(
+        self,
+        postgres_url: str,
+        replica_urls: list[str],
+        config: ReplicaConfig,
+        **kwargs,
+    ) -> None:
+        super().__init__(postgres_url, **kwargs)
+        self.config = config
+        # replicas get the same engine settings as the primary
+        self.replicas = [
+            Replica(str(i), InstrumentedDB(url, **kwargs))
+            for i, url in enumerate(replica_urls)
+        ]
+        self._round_robin = itertools.count()
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        # the first check runs right away, replicas are not read from until their lag is known
+        await self.check_replicas()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.close()
+
+    async def disconnect(self) -> None:
+        for replica in self.replicas:
+            await replica.db.disconnect()
+        await super().disconnect()
+
+    async def check_replicas(self) -> None:
+        for replica in self.replicas:
+            try:
+                await replica.check_lag(self.config.REPLICA_LAG_CHECK_TIMEOUT_SECONDS)
+            except Exception as e:
+                self.logger.error(f"Replica {replica.name} lag check failed: {e}")
+
+    def get_available_replicas(self) -> list[Replica]:
+        return [
+            r
+            for r in self.replicas
+            if r.lag is not None and r.lag <= self.config.REPLICA_MAX_LAG_SECONDS
+        ]
+
+    def get_replica(self) -> Replica | None:
+        available = self.get_available_replicas()
+        if not available:
+            return None
+        return available[next(self._round_robin) % len(available)]
+
+    @contextlib.asynccontextmanager
+    async def get_session(
+        self,
+        reuse_session: AsyncSession = None,
+        readonly: bool | None = None,
+    ) -> typing.AsyncIterator[AsyncSession]:
+        if reuse_session is None and readonly:
+            replica = None if _pinned_to_primary.get() else self.get_replica()
+            if replica is not None:
+                _READS.labels("replica").inc()
+                async with replica.db.get_session(readonly=True) as session:
+                    yield session
+                return
+            _READS.labels("primary").inc()
+        elif reuse_session is None:
+            pin_to_primary()
+        async with super().get_session(reuse_session, readonly) as session:
+            yield session
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.REPLICA_LAG_CHECK_INTERVAL_SECONDS)
+            await self.check_replicas()
+
+
+class ReadYourWritesMiddleware:
+    """
+    Scopes the pinning to the primary (see pin_to_primary) to a single request.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        super().__init__()
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        token = _pinned_to_primary.set(False)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _pinned_to_primary.reset(token)
+
+
+def create_routing_db(
+    config: ReplicaConfig,
+    sql_config: SqlConfig,
+    environ: typing.Mapping = os.environ,
+) -> InstrumentedDB:
+    """
+    Same as create_db, returns a RoutingDB when replicas are configured.
+    """
+    # reuse the engine settings read by create_db, its engine has not connected yet and is simply dropped
+    db = create_db(environ)
+    kwargs = dict(
+        echo=db.echo,
+        pool_size=db.pool_size,
+        pool_timeout=db.pool_timeout,
+        max_overflow=db.max_overflow,
+        slow_query_ms=sql_config.SQL_SLOW_QUERY_MS,
+    )
+    if not config.POSTGRES_REPLICA_URLS:
+        return InstrumentedDB(db.postgres_url, **kwargs)
+    return RoutingDB(db.postgres_url, config.POSTGRES_REPLICA_URLS, config, **kwargs)
@@ -1,12 +1,28 @@
+import asyncio
 import datetime
+import functools
+import inspect
+import typing
 import uuid
 
+import asyncpg
 import pydantic
 import sqlalchemy
+import sqlalchemy.dialects.postgresql
+import sqlalchemy.event
 import sqlalchemy.orm
 from asyncpg_datalayer.base_repository import BaseRepository
 from asyncpg_datalayer.base_table import Base
 from asyncpg_datalayer.db import DB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import Cache
+
+from .asyncpg_utils import get_asyncpg_connection
+from .batch_loader import BatchLoader, MemoizedLoader, RequestScopedLoader
+from .change_feed import ChangeEvent
+from .counting import CountingMixin, CountStrategy, RowCount
+from .routing import read_from_primary
 
 
 class _UsersTable(Base):
@@ -32,6 +48,18 @@ class _UsersTable(Base):
 UsersRecord = _UsersTable
 
 
+class TableVersion(typing.NamedTuple):
+    version: int
+    updated_at: datetime.datetime
+    # kept by triggers, see the migration v006-table-row-counts, None when not counted
+    row_count: int | None = None
+
+
+_CREATE_LOAD_TABLE = (
+    "CREATE TEMP TABLE _users_load (LIKE users INCLUDING DEFAULTS) ON COMMIT DROP"
+)
+
+
 class UsersRecordInsert(pydantic.BaseModel):
     model_config = pydantic.ConfigDict(extra="forbid")
     id: uuid.UUID = pydantic.Field(default_factory=uuid.uuid4)
@@ -49,12 +77,131 @@ class UsersRecordUpdate(pydantic.BaseModel):
     updated_at: datetime.datetime | None = None
 
 
-class UsersRepository(BaseRepository[UsersRecord]):
-    def __init__(self, db: DB) -> None:
+class UsersFilters(pydantic.BaseModel):
+    """
+    Filters of the users listing, all optional and combined with AND. Each one is served by an index, see the
+    migration v005-users-search-indexes.
+    """
+
+    model_config = pydantic.ConfigDict(extra="forbid")
+    # case-sensitive, emails starting with it
+    email_prefix: str | None = None
+    # case-insensitive, names containing it, best with 3 characters or more (trigrams)
+    name_contains: str | None = None
+    # ranges are half-open: from inclusive, to exclusive
+    created_from: datetime.datetime | None = None
+    created_to: datetime.datetime | None = None
+    updated_from: datetime.datetime | None = None
+    updated_to: datetime.datetime | None = None
+
+    @pydantic.field_validator(
+        "created_from", "created_to", "updated_from", "updated_to"
+    )
+    @classmethod
+    def _to_naive_utc(cls, value: datetime.datetime | None):
+        # the columns are timestamps without time zone, in UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(datetime.UTC).replace(tzinfo=None)
+        return value
+
+    def to_where_clauses(self) -> list[sqlalchemy.ColumnElement[bool]]:
+        clauses = []
+        if self.email_prefix:
+            clauses.append(
+                _UsersTable.email.startswith(self.email_prefix, autoescape=True)
+            )
+        if self.name_contains:
+            clauses.append(
+                _UsersTable.name.icontains(self.name_contains, autoescape=True)
+            )
+        if self.created_from is not None:
+            clauses.append(_UsersTable.created_at >= self.created_from)
+        if self.created_to is not None:
+            clauses.append(_UsersTable.created_at < self.created_to)
+        if self.updated_from is not None:
+            clauses.append(_UsersTable.updated_at >= self.updated_from)
+        if self.updated_to is not None:
+            clauses.append(_UsersTable.updated_at < self.updated_to)
+        return clauses
+
+
+def _invalidates_cache(method):
+    """
+    Wraps a write method of BaseRepository, so that it drops the cached users, see UsersRepository.after_write.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(self: "UsersRepository", *args, **kwargs):
+        result = await method(self, *args, **kwargs)
+        reuse_session = signature.bind(self, *args, **kwargs).arguments.get(
+            "reuse_session"
+        )
+        await self.after_write(reuse_session)
+        return result
+
+    return wrapper
+
+
+class UsersRepository(CountingMixin, BaseRepository[UsersRecord]):
+    def __init__(
+        self,
+        db: DB,
+        cache: Cache | None = None,
+        loader: BatchLoader | MemoizedLoader | RequestScopedLoader | None = None,
+    ) -> None:
         super().__init__(db, UsersRecord)
+        self.cache = cache
+        # batches get_row_by_id, built on get_rows_by_ids
+        self.loader = loader
+        # invalidations scheduled on commit, see after_write
+        self._tasks: set[asyncio.Task] = set()
+
+    # every write of BaseRepository
+    insert = _invalidates_cache(BaseRepository.insert)
+    insert_many = _invalidates_cache(BaseRepository.insert_many)
+    insert_multikey = _invalidates_cache(BaseRepository.insert_multikey)
+    insert_many_multikey = _invalidates_cache(BaseRepository.insert_many_multikey)
+    update_by_id = _invalidates_cache(BaseRepository.update_by_id)
+    update_many = _invalidates_cache(BaseRepository.update_many)
+    delete_by_id = _invalidates_cache(BaseRepository.delete_by_id)
+    delete_by_ids = _invalidates_cache(BaseRepository.delete_by_ids)
+    delete_many = _invalidates_cache(BaseRepository.delete_many)
 
     ### custom methods go below ###
 
+    async def after_write(self, reuse_session: AsyncSession | None = None) -> None:
+        """
+        Drops the cached users once a write is committed. A write in its own session is committed already. A write in
+        the session of the caller is committed by the caller later: invalidating now would let a read in between cache
+        the rows as they were before the commit, so the cache is invalidated after the commit instead, if any.
+        """
+        if reuse_session is None:
+            await self._invalidate_cache()
+            return
+        sqlalchemy.event.listen(
+            reuse_session.sync_session, "after_commit", self._on_commit, once=True
+        )
+
+    def _on_commit(self, session: sqlalchemy.orm.Session) -> None:
+        # runs within the commit, which is awaited in the event loop, but cannot await
+        task = asyncio.get_running_loop().create_task(self._invalidate_cache())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _invalidate_cache(self) -> None:
+        if self.loader is not None:
+            self.loader.clear()
+        if self.cache is not None:
+            await self.cache.invalidate(_UsersTable.__tablename__)
+
+    async def on_change(self, event: ChangeEvent) -> None:
+        """
+        ChangeFeed listener, drops the cached users when they are changed, including by other processes.
+        """
+        if self.cache is not None and event.table in (None, _UsersTable.__tablename__):
+            await self.cache.invalidate(_UsersTable.__tablename__)
+
     async def get_distinct_emails(
         self,
         filters: dict | None = None,
@@ -65,3 +212,230 @@ class UsersRepository(BaseRepository[UsersRecord]):
             response = await session.execute(query)
             results = response.scalars().all()
         return results
+
+    async def get_version(
+        self, reuse_session: AsyncSession | None = None
+    ) -> TableVersion:
+        """
+        Returns the change counter of the users table and the time of the last change. Both are bumped by a trigger
+        after every statement that modifies the table, see the migration v003-table-versions. Also returns the row
+        count of the table, kept in the same row, see CountStrategy.COUNTER.
+        """
+        query = sqlalchemy.text(
+            "SELECT version, updated_at, row_count FROM table_versions WHERE table_name = :table_name"
+        ).bindparams(table_name=_UsersTable.__tablename__)
+        async with self.db.get_session(reuse_session, readonly=True) as session:
+            response = await session.execute(query)
+            return TableVersion(*response.one())
+
+    async def count_users(
+        self,
+        strategy: CountStrategy,
+        filters: UsersFilters | None = None,
+        row_count: int | None = None,
+    ) -> RowCount:
+        """
+        `row_count`, the counter read along with the version (see get_version), spares reading it again.
+        """
+        where = filters.to_where_clauses() if filters is not None else []
+        return await self.count_rows(strategy, where, row_count)
+
+    async def get_page_with_version(
+        self,
+        size: int,
+        after: tuple[datetime.datetime, uuid.UUID] | None = None,
+        filters: UsersFilters | None = None,
+        is_modified: typing.Callable[[TableVersion], bool] | None = None,
+    ) -> tuple[TableVersion, list[tuple] | None]:
+        """
+        Keyset pagination ordered by (created_at, id): returns the first `size` users strictly after `after`, so the
+        cost of a page does not depend on how deep it is. Rows are plain tuples (id, email, name, created_at,
+        updated_at), no ORM object is built. Returned together with the version of the table, both read in the same
+        session, so from the same DB when reads go to replicas. The version is read first, so that a concurrent change can only make
+        it older than the page. The page is read only when `is_modified(version)`, if given, is true, e.g. not when a
+        conditional GET can be answered with 304. Cached as a whole, cached pages come with their own version.
+        """
+        if self.cache is None:
+            return await self._get_page_with_version(size, after, filters, is_modified)
+        filters_key = filters.model_dump_json(exclude_none=True) if filters else None
+        return await self.cache.get_or_load(
+            _UsersTable.__tablename__,
+            f"page_with_version:{size}:{after}:{filters_key}",
+            lambda: self._load_page_with_version(size, after, filters),
+        )
+
+    async def _load_page_with_version(
+        self,
+        size: int,
+        after: tuple[datetime.datetime, uuid.UUID] | None,
+        filters: UsersFilters | None,
+    ) -> tuple[TableVersion, list[tuple] | None]:
+        # Cached for every request, so read from the primary: right after a write, and its invalidation, a lagging
+        # replica would have the page cached as it was before the write, until it expires.
+        with read_from_primary():
+            return await self._get_page_with_version(size, after, filters)
+
+    async def _get_page_with_version(
+        self,
+        size: int,
+        after: tuple[datetime.datetime, uuid.UUID] | None,
+        filters: UsersFilters | None,
+        is_modified: typing.Callable[[TableVersion], bool] | None = None,
+    ) -> tuple[TableVersion, list[tuple] | None]:
+        async with self.db.get_session(readonly=True) as session:
+            version = await self.get_version(session)
+            if is_modified is not None and not is_modified(version):
+                return version, None
+            return version, await self._get_page_after(size, after, filters, session)
+
+    async def _get_page_after(
+        self,
+        size: int,
+        after: tuple[datetime.datetime, uuid.UUID] | None,
+        filters: UsersFilters | None,
+        reuse_session: AsyncSession | None = None,
+    ) -> list[tuple]:
+        query = self.get_page_query(size, after, filters)
+        async with self.db.get_session(reuse_session, readonly=True) as session:
+            response = await session.execute(query)
+            results = [tuple(r) for r in response.all()]
+        return results
+
+    @staticmethod
+    def get_page_query(
+        size: int,
+        after: tuple[datetime.datetime, uuid.UUID] | None = None,
+        filters: UsersFilters | None = None,
+    ) -> sqlalchemy.Select:
+        query = sqlalchemy.select(
+            _UsersTable.id,
+            _UsersTable.email,
+            _UsersTable.name,
+            _UsersTable.created_at,
+            _UsersTable.updated_at,
+        )
+        if after is not None:
+            query = query.where(
+                sqlalchemy.tuple_(_UsersTable.created_at, _UsersTable.id)
+                > sqlalchemy.tuple_(*after)
+            )
+        if filters is None:
+            return query.order_by(_UsersTable.created_at, _UsersTable.id).limit(size)
+        query = query.where(*filters.to_where_clauses())
+        if filters.updated_from is None and filters.updated_to is None:
+            return query.order_by(_UsersTable.created_at, _UsersTable.id).limit(size)
+        # Collect the rows in the updated_at range first (through its BRIN index), then sort them. Otherwise the
+        # planner walks the (created_at, id) index expecting to meet matching rows early, but updated_at grows with
+        # created_at, so it reads every row older than the range first.
+        matched = query.cte("matched").prefix_with("MATERIALIZED")
+        return (
+            sqlalchemy.select(matched)
+            .order_by(matched.c.created_at, matched.c.id)
+            .limit(size)
+        )
+
+    async def get_rows_by_ids(
+        self,
+        ids: list[uuid.UUID],
+    ) -> dict[uuid.UUID, tuple]:
+        """
+        Returns the (id, email, name, created_at, updated_at) rows of the users found, by id. The ids are bound as a
+        single array parameter, so the statement is the same whatever their number.
+        """
+        query = sqlalchemy.select(
+            _UsersTable.id,
+            _UsersTable.email,
+            _UsersTable.name,
+            _UsersTable.created_at,
+            _UsersTable.updated_at,
+        ).where(
+            _UsersTable.id
+            == sqlalchemy.any_(
+                sqlalchemy.bindparam(
+                    "ids",
+                    ids,
+                    type_=sqlalchemy.dialects.postgresql.ARRAY(sqlalchemy.Uuid),
+                )
+            )
+        )
+        async with self.db.get_session(readonly=True) as session:
+            response = await session.execute(query)
+            results = {r[0]: tuple(r) for r in response.all()}
+        return results
+
+    async def get_row_by_id(self, id: uuid.UUID) -> tuple | None:
+        if self.loader is None:
+            return (await self.get_rows_by_ids([id])).get(id)
+        return await self.loader.load(id)
+
+    async def iter_chunks(
+        self,
+        chunk_size: int = 1000,
+    ) -> typing.AsyncIterator[list[asyncpg.Record]]:
+        """
+        Streams all users ordered by (created_at, id) through a server-side cursor, `chunk_size` rows at a time, so
+        memory does not grow with the table. Rows have the columns id, email, name, created_at, updated_at.
+        """
+        query = "SELECT id, email, name, created_at, updated_at FROM users ORDER BY created_at, id"
+        async with self.db.get_session(readonly=True) as session:
+            conn = await get_asyncpg_connection(session)
+            # server-side cursors only live within a transaction
+            async with conn.transaction():
+                cursor = await conn.cursor(query)
+                while rows := await cursor.fetch(chunk_size):
+                    yield rows
+
+    async def bulk_insert(
+        self,
+        records: typing.Iterable[tuple],
+        columns: typing.Sequence[str] = ("email",),
+    ) -> int:
+        """
+        Loads `records` with COPY into a temporary table, then moves them into users skipping the emails that
+        already exist, so deduplication happens in the database. `records` is consumed lazily and can be a
+        generator. Returns the number of inserted users.
+        """
+        async with self.db.get_session() as session:
+            conn = await get_asyncpg_connection(session)
+            async with conn.transaction():
+                await conn.execute(_CREATE_LOAD_TABLE)
+                inserted = await self._copy_and_insert(conn, records, columns)
+        await self._invalidate_cache()
+        return inserted
+
+    async def bulk_insert_batches(
+        self,
+        batches: typing.AsyncIterator[list[tuple]],
+        columns: typing.Sequence[str] = ("email",),
+    ) -> int:
+        """
+        Same as bulk_insert, for records arriving in batches: each batch is copied into the temporary table and moved
+        into users as soon as it arrives, within a single transaction. Returns the number of inserted users.
+        """
+        inserted = 0
+        async with self.db.get_session() as session:
+            conn = await get_asyncpg_connection(session)
+            async with conn.transaction():
+                await conn.execute(_CREATE_LOAD_TABLE)
+                async for batch in batches:
+                    inserted += await self._copy_and_insert(conn, batch, columns)
+                    await conn.execute("TRUNCATE _users_load")
+        await self._invalidate_cache()
+        return inserted
+
+    @staticmethod
+    async def _copy_and_insert(
+        conn: asyncpg.Connection,
+        records: typing.Iterable[tuple],
+        columns: typing.Sequence[str],
+    ) -> int:
+        column_list = ", ".join(columns)
+        await conn.copy_records_to_table(
+            "_users_load", records=records, columns=list(columns)
+        )
+        status = await conn.execute(
+            f"INSERT INTO users ({column_list}) SELECT {column_list} FROM _users_load"
+            " ON CONFLICT (email) DO NOTHING"
+        )
+        # status is like "INSERT 0 <count>"
+        return int(status.split()[-1])
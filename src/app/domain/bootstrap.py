@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import os
+
+import asyncpg
+from asyncpg_datalayer.db import DB
+from asyncpg_datalayer.migrationtool.main import apply_migrations
+
+from app import migrations_dir
+from app.core.startup import StartupTimer
+from app.domain.create_some_data import create_some_data, get_seed_size
+
+logger = logging.getLogger(__name__)
+
+# arbitrary key of the Postgres advisory lock serializing bootstrap across processes and replicas
+_BOOTSTRAP_LOCK_KEY = 7_263_610_381
+
+
+def get_migrations_checksum() -> str:
+    """
+    Checksum of the names and contents of all migration files, which changes whenever a migration is added.
+    """
+    sha256 = hashlib.sha256()
+    for filename in sorted(os.listdir(migrations_dir)):
+        if filename.endswith(".sql"):
+            sha256.update(filename.encode())
+            with open(os.path.join(migrations_dir, filename), "rb") as file:
+                sha256.update(file.read())
+    return sha256.hexdigest()
+
+
+async def _get_state(conn: asyncpg.Connection) -> dict[str, str]:
+    try:
+        rows = await conn.fetch("SELECT key, value FROM _bootstrap_state")
+    except asyncpg.UndefinedTableError:
+        # before the first migrations
+        return {}
+    return {r["key"]: r["value"] for r in rows}
+
+
+async def _set_state(conn: asyncpg.Connection, key: str, value: str) -> None:
+    await conn.execute(
+        "INSERT INTO _bootstrap_state (key, value) VALUES ($1, $2)"
+        " ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = now()",
+        key,
+        value,
+    )
+
+
+async def bootstrap(db: DB, timer: StartupTimer | None = None) -> None:
+    """
+    Applies the migrations and seeds the data, unless the markers left by a previous bootstrap say they are up to
+    date, which costs a single query. Otherwise runs under a Postgres advisory lock, held on a dedicated connection
+    outside the pool, so that concurrent processes run it one at a time instead of racing each other.
+    """
+    timer = timer or StartupTimer()
+    expected = {
+        "migrations": get_migrations_checksum(),
+        "seed": f"users:{get_seed_size()}",
+    }
+    conn = await asyncpg.connect(db.postgres_url)
+    try:
+        with timer.phase("bootstrap_check"):
+            state = await _get_state(conn)
+        if state == expected:
+            logger.info("Bootstrap skipped, migrations and seed data are up to date")
+            return
+        with timer.phase("bootstrap_lock"):
+            await conn.execute("SELECT pg_advisory_lock($1)", _BOOTSTRAP_LOCK_KEY)
+        try:
+            # another process may have done it while we were waiting for the lock
+            state = await _get_state(conn)
+            if state.get("migrations") != expected["migrations"]:
+                with timer.phase("migrations"):
+                    await apply_migrations(db.postgres_url, migrations_dir)
+                    await _set_state(conn, "migrations", expected["migrations"])
+            if state.get("seed") != expected["seed"]:
+                with timer.phase("seed"):
+                    await create_some_data(db)
+                    await _set_state(conn, "seed", expected["seed"])
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", _BOOTSTRAP_LOCK_KEY)
+    finally:
+        await conn.close()
+    logger.info(f"Bootstrap finished, {timer}", extra={"data": timer.to_dict()})
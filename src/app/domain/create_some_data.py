@@ -5,30 +5,27 @@ import time
 from asyncpg_datalayer.db import DB
 
 from app.datalayer.facade import DatalayerFacade
-from app.datalayer.users import UsersRecordInsert
 
 logger = logging.getLogger(__name__)
 
 
+def get_seed_size() -> int:
+    return int(os.getenv("APP_SEED_SIZE", default=None) or 10000)
+
+
 async def create_some_data(db: DB):
     facade = DatalayerFacade(db)
 
-    num_of_users = os.getenv("APP_SEED_SIZE", default=None) or 10000
-
-    emails = await facade.users.get_distinct_emails()
-    insert_objs: list[UsersRecordInsert] = []
-    for i in range(1, num_of_users + 1):
-        email = f"user+{i}@example.com"
-        if email not in emails:
-            insert_objs.append(UsersRecordInsert(email=email))
+    num_of_users = get_seed_size()
 
     start = time.perf_counter()
 
-    batch_size = 500
-    for i in range(0, len(insert_objs), batch_size):
-        batch = insert_objs[i : i + batch_size]
-        await facade.users.insert_many(batch)
+    # rows are generated lazily and streamed with COPY, existing emails are skipped by the database
+    rows = ((f"user+{i}@example.com",) for i in range(1, num_of_users + 1))
+    inserted = await facade.users.bulk_insert(rows, columns=("email",))
 
     end = time.perf_counter()
     elapsed = int((end - start) * 1000)
-    logger.info(f"Create {num_of_users} users finished, elapsed {elapsed} ms")
+    logger.info(
+        f"Create {num_of_users} users finished, {inserted} inserted, elapsed {elapsed} ms"
+    )
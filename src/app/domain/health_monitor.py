@@ -0,0 +1,87 @@
+import asyncio
+import datetime
+import logging
+import time
+
+import asyncpg
+import pydantic_settings
+from asyncpg_datalayer.db import DB
+from prometheus_client import Gauge, Histogram
+
+_DB_UP = Gauge(
+    "app_db_up", "Whether the last DB health check succeeded", multiprocess_mode="min"
+)
+_DB_CHECK_SECONDS = Histogram(
+    "app_db_health_check_seconds",
+    "Latency of the DB health checks",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class HealthConfig(pydantic_settings.BaseSettings):
+    HEALTH_CHECK_INTERVAL_SECONDS: float = 5.0
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 2.0
+
+
+class HealthMonitor:
+    """
+    Checks the DB in the background, on a dedicated connection outside the pool, so that health probes can be
+    answered from the last result without any I/O and do not compete with requests for pool connections.
+    """
+
+    def __init__(self, db: DB, config: HealthConfig) -> None:
+        super().__init__()
+        self.logger = logging.getLogger(f"{self.__module__}.{type(self).__name__}")
+        self.db = db
+        self.config = config
+        self.is_up = False
+        self.latency: float | None = None
+        self.checked_at: datetime.datetime | None = None
+        self._conn: asyncpg.Connection | None = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        # the first check runs right away, so the status is known before serving requests
+        await self.check()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+
+    async def check(self) -> bool:
+        timeout = self.config.HEALTH_CHECK_TIMEOUT_SECONDS
+        start = time.perf_counter()
+        try:
+            if self._conn is None or self._conn.is_closed():
+                self._conn = await asyncpg.connect(
+                    self.db.postgres_url, timeout=timeout
+                )
+            result = await self._conn.fetchval("SELECT 1", timeout=timeout)
+            is_up = result == 1
+        except Exception as e:
+            self.logger.error(e)
+            is_up = False
+            await self._close()
+        self.latency = time.perf_counter() - start
+        self.checked_at = datetime.datetime.now(datetime.UTC)
+        self.is_up = is_up
+        _DB_UP.set(1 if is_up else 0)
+        _DB_CHECK_SECONDS.observe(self.latency)
+        return is_up
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.HEALTH_CHECK_INTERVAL_SECONDS)
+            await self.check()
+
+    async def _close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.terminate()
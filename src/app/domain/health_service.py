@@ -4,32 +4,89 @@ import fastapi
 import sqlalchemy
 from asyncpg_datalayer.db import DB
 
-
-def get_db(request: fastapi.Request) -> DB:
-    if not hasattr(request.app.state, "db"):
-        raise RuntimeError("DB not found in app.state")
-    return request.app.state.db
+from app.core.admission import PrioritySemaphore
+from app.core.container import get_container
+from app.datalayer.routing import RoutingDB
+from app.domain.health_monitor import HealthMonitor
 
 
 class HealthService:
     def __init__(
         self,
-        db: DB = fastapi.Depends(get_db),
+        db: DB,
+        monitor: HealthMonitor,
+        # reports the requests waiting for a slot, when admission control is enabled
+        admission: PrioritySemaphore | None = None,
     ) -> None:
         super().__init__()
         self.logger = logging.getLogger(f"{self.__module__}.{type(self).__name__}")
         self.db = db
+        self.monitor = monitor
+        self.admission = admission
 
     async def check(self) -> bool:
-        status = await self._check_db()
-        return status
+        # last result of the background monitor, no I/O
+        return self.monitor.is_up
+
+    async def deep_check(self) -> dict:
+        """
+        Checks the DB through the pool, like requests do, and reports the pool statistics.
+        """
+        status, pool = await self._check_db()
+        result = {
+            "status": "up" if status else "down",
+            "db": {
+                "up": self.monitor.is_up,
+                "latency_ms": (
+                    round(self.monitor.latency * 1000, 3)
+                    if self.monitor.latency is not None
+                    else None
+                ),
+                "checked_at": (
+                    self.monitor.checked_at.isoformat()
+                    if self.monitor.checked_at
+                    else None
+                ),
+            },
+            "pool": pool,
+        }
+        if isinstance(self.db, RoutingDB):
+            result["replicas"] = [
+                {
+                    "name": r.name,
+                    "lag_s": r.lag,
+                    "available": r in self.db.get_available_replicas(),
+                }
+                for r in self.db.replicas
+            ]
+        return result
 
-    async def _check_db(self) -> bool:
+    async def _check_db(self) -> tuple[bool, dict | None]:
+        # served by a replica, like any readonly session, when replicas are configured
         try:
             async with self.db.get_session(readonly=True) as session:
                 response = await session.execute(sqlalchemy.text("SELECT 1"))
                 result = response.scalar_one_or_none()
-            return result == 1
+                pool = self._get_pool_stats(self.db.engine.sync_engine.pool)
+            return result == 1, pool
         except Exception as e:
             self.logger.error(e)
-            return False
+            return False, None
+
+    def _get_pool_stats(self, pool: sqlalchemy.Pool) -> dict:
+        # QueuePool only, other pools do not keep these statistics. Note that `in_use` includes this check,
+        # unless it was served by a replica.
+        stats = {
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "in_use": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "idle": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            # requests queued by admission control, waiting for a connection
+            "waiting": self.admission.queued if self.admission is not None else None,
+        }
+        return stats
+
+
+async def get_health_service(request: fastapi.Request) -> HealthService:
+    # async, not to be run in the threadpool like sync dependencies are
+    return get_container(request).get(HealthService)
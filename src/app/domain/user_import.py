@@ -0,0 +1,164 @@
+import asyncio
+import csv
+import typing
+
+import pydantic
+
+T = typing.TypeVar("T")
+
+_MAX_LINE_BYTES = 64 * 1024
+_CSV_COLUMNS = ("email", "name")
+
+
+class UserImportRow(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(extra="forbid")
+    email: str = pydantic.Field(pattern=r"^[^@\s]+@[^@\s]+$", max_length=320)
+    name: str | None = None
+
+
+class UserImportError(pydantic.BaseModel):
+    line: int
+    error: str
+
+
+class UserImportResult(pydantic.BaseModel):
+    received: int
+    inserted: int
+    # valid rows whose email already existed
+    duplicates: int
+    failed: int
+    # the first errors only, failed counts them all
+    errors: list[UserImportError]
+
+
+async def iter_lines(
+    chunks: typing.AsyncIterator[bytes],
+    max_line_bytes: int = _MAX_LINE_BYTES,
+) -> typing.AsyncIterator[bytes]:
+    """
+    Splits a stream of bytes into lines, holding at most one line (and one chunk) in memory.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.removesuffix(b"\r")
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"line longer than {max_line_bytes} bytes")
+    if buffer:
+        yield buffer.removesuffix(b"\r")
+
+
+async def prefetch(
+    items: typing.AsyncIterator[T],
+    size: int = 1,
+) -> typing.AsyncIterator[T]:
+    """
+    Produces up to `size` items ahead in a separate task, so the producer (e.g. reading the request body) and the
+    consumer (e.g. writing to the database) overlap instead of taking turns.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+    end = object()
+
+    async def _produce():
+        try:
+            async for item in items:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(end)
+
+    task = asyncio.create_task(_produce())
+    try:
+        while (item := await queue.get()) is not end:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+class UserImporter:
+    """
+    Parses NDJSON or CSV lines into (email, name) rows, validating one row at a time. Invalid rows are skipped and
+    reported with their line number, up to `max_errors` of them.
+    """
+
+    def __init__(
+        self,
+        format: typing.Literal["ndjson", "csv"],
+        max_errors: int = 1000,
+    ) -> None:
+        super().__init__()
+        self.format = format
+        self.max_errors = max_errors
+        self.received = 0
+        self.failed = 0
+        self.errors: list[UserImportError] = []
+        self._csv_header: list[str] | None = None
+
+    async def iter_batches(
+        self,
+        lines: typing.AsyncIterator[bytes],
+        batch_size: int,
+    ) -> typing.AsyncIterator[list[tuple]]:
+        batch = []
+        line_number = 0
+        async for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            if self.format == "csv" and self._csv_header is None:
+                self._csv_header = self._parse_csv_header(line)
+                continue
+            self.received += 1
+            try:
+                row = self._parse(line)
+            except (pydantic.ValidationError, ValueError) as e:
+                self._add_error(line_number, e)
+                continue
+            batch.append((row.email, row.name))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _parse(self, line: bytes) -> UserImportRow:
+        if self.format == "ndjson":
+            return UserImportRow.model_validate_json(line)
+        values = next(csv.reader([line.decode()]))
+        if len(values) != len(self._csv_header):
+            raise ValueError(
+                f"expected {len(self._csv_header)} values, got {len(values)}"
+            )
+        # an empty CSV value means no value
+        return UserImportRow.model_validate(
+            {k: v for k, v in zip(self._csv_header, values) if v != ""}
+        )
+
+    @staticmethod
+    def _parse_csv_header(line: bytes) -> list[str]:
+        header = [c.strip() for c in next(csv.reader([line.decode()]))]
+        if "email" not in header or not set(header) <= set(_CSV_COLUMNS):
+            raise ValueError(f"invalid CSV header, expected columns {_CSV_COLUMNS}")
+        return header
+
+    def _add_error(self, line_number: int, e: Exception) -> None:
+        self.failed += 1
+        if len(self.errors) >= self.max_errors:
+            return
+        if isinstance(e, pydantic.ValidationError):
+            message = "; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc']) or 'row'}: {err['msg']}"
+                for err in e.errors(include_url=False)
+            )
+        else:
+            message = str(e)
+        self.errors.append(UserImportError(line=line_number, error=message))
@@ -1,11 +1,24 @@
+import base64
 import datetime
 import logging
+import typing
 import uuid
 
 import fastapi
 import pydantic
 
+from app.core.container import get_container
+from app.core.errors import NotFoundException
+from app.datalayer.change_feed import ChangeFeed, ChangeSubscription
+from app.datalayer.counting import CountStrategy, RowCount
 from app.datalayer.facade import DatalayerFacade
+from app.datalayer.users import TableVersion, UsersFilters, UsersRecord
+from app.domain.user_import import (
+    UserImporter,
+    UserImportResult,
+    iter_lines,
+    prefetch,
+)
 
 
 class UserDto(pydantic.BaseModel):
@@ -16,27 +29,146 @@ class UserDto(pydantic.BaseModel):
     updated_at: datetime.datetime
 
 
+def encode_cursor(created_at: datetime.datetime, id: uuid.UUID) -> str:
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split("|")
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(id)
+    except ValueError as e:
+        # binascii.Error and UnicodeDecodeError are both ValueError subclasses
+        raise ValueError("invalid cursor") from e
+
+
+def _split_page(rows: list[tuple], size: int) -> tuple[list[tuple], str | None]:
+    # rows holds one extra row when there is a next page
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        _id, _, _, created_at, _ = rows[-1]
+        next_cursor = encode_cursor(created_at, _id)
+    return rows, next_cursor
+
+
+class UserPage(typing.NamedTuple):
+    version: TableVersion
+    # None when not modified, see UserService.get_user_page
+    rows: list[tuple] | None
+    next_cursor: str | None
+
+
 class UserService:
     def __init__(
         self,
-        facade: DatalayerFacade = fastapi.Depends(),
+        facade: DatalayerFacade,
+        count_strategy: CountStrategy | typing.Literal["none"] = CountStrategy.COUNTER,
+        change_feed: ChangeFeed | None = None,
     ) -> None:
         super().__init__()
         self.logger = logging.getLogger(f"{self.__module__}.{type(self).__name__}")
         self.facade = facade
+        self.count_strategy = count_strategy
+        self.change_feed = change_feed
+
+    async def count_users(
+        self,
+        filters: UsersFilters | None = None,
+        version: TableVersion | None = None,
+    ) -> RowCount | None:
+        """
+        Total of the users matching the filters, with the configured strategy, None when counting is disabled. The
+        row count of `version`, e.g. the one of a page, is used instead of reading the counter again.
+        """
+        if self.count_strategy == "none":
+            return None
+        row_count = version.row_count if version is not None else None
+        return await self.facade.users.count_users(
+            self.count_strategy, filters, row_count
+        )
+
+    def subscribe_user_changes(
+        self,
+    ) -> typing.ContextManager[ChangeSubscription] | None:
+        """
+        Changes of the users, from any process, None when the change feed is disabled, see ChangeFeedConfig.
+        """
+        if self.change_feed is None:
+            return None
+        return self.change_feed.subscribe([UsersRecord.__tablename__])
+
+    def get_known_users_version(self) -> int | None:
+        """
+        Version of the users table as of the last change notified, None when unknown.
+        """
+        if self.change_feed is None:
+            return None
+        return self.change_feed.get_version(UsersRecord.__tablename__)
+
+    async def get_user_page(
+        self,
+        size: int,
+        cursor: str | None = None,
+        filters: UsersFilters | None = None,
+        is_modified: typing.Callable[[TableVersion], bool] | None = None,
+    ) -> UserPage:
+        """
+        Returns a page of users as (id, email, name, created_at, updated_at) tuples, without building any model,
+        together with the version of the users it was read at (see UsersRepository.get_page_with_version) and the
+        cursor of the next page, if any. The next pages must be requested with the same filters. Rows are None when
+        `is_modified(version)` is false.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        # fetch one extra row to know whether there is a next page
+        version, rows = await self.facade.users.get_page_with_version(
+            size=size + 1, after=after, filters=filters, is_modified=is_modified
+        )
+        if rows is None:
+            return UserPage(version, None, None)
+        rows, next_cursor = _split_page(rows, size)
+        return UserPage(version, rows, next_cursor)
+
+    async def get_user_row(self, id: uuid.UUID) -> tuple:
+        row = await self.facade.users.get_row_by_id(id)
+        if row is None:
+            raise NotFoundException(f"user {id} not found")
+        return row
 
-    async def get_users(self, size: int) -> list[UserDto]:
-        records, _ = await self.facade.users.get_page(
-            size=size,
-            skip_count=True,
+    async def iter_users(
+        self,
+        chunk_size: int = 1000,
+    ) -> typing.AsyncIterator[list[tuple]]:
+        async for rows in self.facade.users.iter_chunks(chunk_size=chunk_size):
+            yield rows
+
+    async def import_users(
+        self,
+        chunks: typing.AsyncIterator[bytes],
+        format: typing.Literal["ndjson", "csv"],
+        batch_size: int = 5000,
+    ) -> UserImportResult:
+        """
+        Imports users from a stream of NDJSON or CSV bytes, e.g. a request body, without reading it whole. Valid rows
+        are written in batches, while the next batch is being parsed, invalid rows are reported.
+        """
+        importer = UserImporter(format)
+        batches = importer.iter_batches(iter_lines(chunks), batch_size)
+        inserted = await self.facade.users.bulk_insert_batches(
+            prefetch(batches), columns=("email", "name")
         )
-        return [
-            UserDto(
-                id=r.id,
-                email=r.email,
-                name=r.name,
-                created_at=r.created_at,
-                updated_at=r.updated_at,
-            )
-            for r in records
-        ]
+        valid = importer.received - importer.failed
+        return UserImportResult(
+            received=importer.received,
+            inserted=inserted,
+            duplicates=valid - inserted,
+            failed=importer.failed,
+            errors=importer.errors,
+        )
+
+
+async def get_user_service(request: fastapi.Request) -> UserService:
+    # async, not to be run in the threadpool like sync dependencies are
+    return get_container(request).get(UserService)
@@ -0,0 +1,116 @@
+"""
+Production entry point, runs the API with one uvicorn worker per core:
+
+    python -m app.serve
+
+Environment:
+- WEB_CONCURRENCY: number of workers, defaults to the number of cores this process may use, i.e. its CPU affinity,
+  capped by the CPU quota of its cgroup (e.g. the CPU limit of the container), and by POOL_TOTAL_SIZE
+- POOL_TOTAL_SIZE: total number of Postgres connections the API may open, split evenly across workers (sets
+  POOL_SIZE of each worker, with no overflow, net of the dedicated connections each worker opens outside its pool).
+  Defaults to 80, below the max_connections of a default Postgres (100), leaving room for other clients.
+  POOL_SIZE and POOL_MAX_OVERFLOW, when set, are used as they are instead.
+- HOST, PORT: bind address, default to 0.0.0.0:8000
+
+Migrations and seed data run once, here, before the workers start. Workers skip them (BOOTSTRAP_ON_STARTUP=0).
+"""
+
+import asyncio
+import logging
+import math
+import os
+import tempfile
+
+import uvicorn
+from asyncpg_datalayer.db_factory import create_db
+
+from app.core.logs import LogConfig, setup_logging
+from app.domain.bootstrap import bootstrap
+
+logger = logging.getLogger("app.serve")
+
+# connections each worker opens outside its pool: HealthMonitor and ChangeFeed
+_DEDICATED_CONNECTIONS_PER_WORKER = 2
+_DEFAULT_POOL_TOTAL_SIZE = 80
+_CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+
+def get_cpu_quota(path: str = _CGROUP_CPU_MAX) -> int | None:
+    """
+    Cores allowed by the cgroup v2 CPU quota, rounded up, None if unlimited or unknown.
+    """
+    try:
+        with open(path) as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        return None
+    if quota == "max":
+        return None
+    return max(1, math.ceil(int(quota) / int(period)))
+
+
+def get_worker_count(pool_total_size: int) -> int:
+    if workers := os.getenv("WEB_CONCURRENCY"):
+        return int(workers)
+    # os.cpu_count() counts the cores of the host, not the ones this process may run on
+    cpus = os.process_cpu_count() or 1
+    quota = get_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, quota)
+    # no more workers than the budget can give a pool connection each, on top of their dedicated ones
+    max_workers = pool_total_size // (1 + _DEDICATED_CONNECTIONS_PER_WORKER)
+    return max(1, min(cpus, max_workers))
+
+
+def split_pool_budget(total: int, workers: int) -> int:
+    pool_size = total // workers - _DEDICATED_CONNECTIONS_PER_WORKER
+    if pool_size < 1:
+        raise ValueError(
+            f"POOL_TOTAL_SIZE={total} is not enough for {workers} workers,"
+            f" need at least {1 + _DEDICATED_CONNECTIONS_PER_WORKER} connections each"
+        )
+    return pool_size
+
+
+async def _bootstrap() -> None:
+    db = create_db(os.environ)
+    try:
+        await bootstrap(db)
+    finally:
+        await db.disconnect()
+
+
+def main() -> None:
+    setup_logging(LogConfig())
+
+    total_pool_size = int(os.getenv("POOL_TOTAL_SIZE") or _DEFAULT_POOL_TOTAL_SIZE)
+    workers = get_worker_count(total_pool_size)
+    if os.getenv("POOL_SIZE"):
+        logger.info(
+            f"Pool size set to {os.environ['POOL_SIZE']}, for {workers} workers"
+        )
+    else:
+        pool_size = split_pool_budget(total_pool_size, workers)
+        os.environ["POOL_SIZE"] = str(pool_size)
+        os.environ.setdefault("POOL_MAX_OVERFLOW", "0")
+        logger.info(f"Pool budget {total_pool_size} split in {workers}x{pool_size}")
+
+    asyncio.run(_bootstrap())
+    os.environ["BOOTSTRAP_ON_STARTUP"] = "0"
+
+    # Workers are separate processes, metrics are aggregated through files shared in this directory.
+    # See https://prometheus.github.io/client_python/multiprocess/
+    if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+    uvicorn.run(
+        "app.main:app",
+        host=os.getenv("HOST", default="0.0.0.0"),
+        port=int(os.getenv("PORT", default=8000)),
+        workers=workers,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,17 @@
+import asyncio
+import csv
+import datetime
+import io
+import json
+import uuid
+
 import pytest
+from fastapi.encoders import jsonable_encoder
+from prometheus_client import REGISTRY
+from starlette.responses import JSONResponse
+
+from app.api.users import UserResponse, render_user_response
+from app.domain.user_service import UserDto, UserService
 
 
 @pytest.mark.asyncio
@@ -6,3 +19,336 @@ async def test_users(aclient):
     res = await aclient.get("/api/users")
     print(f"{res.request.method} {res.url} >> {res.status_code} {res.text}")
     assert res.is_success
+
+
+@pytest.mark.asyncio
+async def test_users_total(aclient):
+    checkouts = REGISTRY.get_sample_value("app_db_pool_acquire_seconds_count") or 0
+    res = await aclient.get("/api/users", params={"size": 1})
+    assert res.status_code == 200
+    # the version, the counter and the page are read with a single connection
+    assert REGISTRY.get_sample_value("app_db_pool_acquire_seconds_count") == (
+        checkouts + 1
+    )
+    # counted by the triggers of the migration v006-table-row-counts
+    total = res.json()["total"]
+    assert total > 0
+    assert res.json()["total_is_estimate"] is False
+
+    res = await aclient.post(
+        "/api/users/bulk",
+        content=b'{"email": "total+1@example.com"}\n{"email": "total+2@example.com"}\n',
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert res.json()["inserted"] == 2
+    res = await aclient.get("/api/users", params={"size": 1})
+    assert res.json()["total"] == total + 2
+
+    # filtered totals are estimated
+    res = await aclient.get("/api/users", params={"size": 1, "email_prefix": "total+"})
+    assert res.json()["total"] >= 1
+    assert res.json()["total_is_estimate"] is True
+
+
+@pytest.mark.asyncio
+async def test_users_cursor_pagination(aclient):
+    res = await aclient.get("/api/users", params={"size": 10})
+    assert res.is_success
+    first_page = res.json()
+    assert len(first_page["data"]) == 10
+    assert first_page["next_cursor"]
+
+    res = await aclient.get(
+        "/api/users", params={"size": 10, "cursor": first_page["next_cursor"]}
+    )
+    assert res.is_success
+    second_page = res.json()
+    assert len(second_page["data"]) == 10
+
+    first_ids = {u["id"] for u in first_page["data"]}
+    second_ids = {u["id"] for u in second_page["data"]}
+    assert not first_ids & second_ids
+    last, first = first_page["data"][-1], second_page["data"][0]
+    assert (last["created_at"], last["id"]) < (first["created_at"], first["id"])
+
+
+@pytest.mark.asyncio
+async def test_users_conditional_get(aclient):
+    res = await aclient.get("/api/users", params={"size": 10})
+    assert res.is_success
+    etag, last_modified = res.headers["etag"], res.headers["last-modified"]
+
+    res = await aclient.get(
+        "/api/users", params={"size": 10}, headers={"if-none-match": etag}
+    )
+    assert res.status_code == 304
+    assert res.content == b""
+    assert res.headers["etag"] == etag
+
+    res = await aclient.get(
+        "/api/users", params={"size": 10}, headers={"if-modified-since": last_modified}
+    )
+    assert res.status_code == 304
+    res = await aclient.get(
+        "/api/users",
+        params={"size": 10},
+        headers={"if-modified-since": "Sun, 06 Nov 1994 08:49:37 -0000"},
+    )
+    assert res.status_code == 200
+
+    # another page has another ETag
+    res = await aclient.get(
+        "/api/users", params={"size": 20}, headers={"if-none-match": etag}
+    )
+    assert res.status_code == 200
+
+    await aclient.post(
+        "/api/users/bulk",
+        content=b'{"email": "etag@example.com"}',
+        headers={"content-type": "application/x-ndjson"},
+    )
+    res = await aclient.get(
+        "/api/users", params={"size": 10}, headers={"if-none-match": etag}
+    )
+    assert res.status_code == 200
+    assert res.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_users_filters(aclient):
+    res = await aclient.get(
+        "/api/users", params={"email_prefix": "user+123", "size": 5}
+    )
+    print(f"{res.request.method} {res.url} >> {res.status_code} {res.text}")
+    assert res.status_code == 200
+    emails = [u["email"] for u in res.json()["data"]]
+    assert len(emails) == 5
+    assert all(e.startswith("user+123") for e in emails)
+
+    # filters are part of the ETag, the same page with other filters is another representation
+    etag = res.headers["etag"]
+    res = await aclient.get(
+        "/api/users",
+        params={"email_prefix": "user+124", "size": 5},
+        headers={"if-none-match": etag},
+    )
+    assert res.status_code == 200
+
+    created_at = res.json()["data"][0]["created_at"]
+    res = await aclient.get(
+        "/api/users",
+        params={"email_prefix": "user+124", "created_to": created_at},
+    )
+    assert res.status_code == 200
+    assert all(u["created_at"] < created_at for u in res.json()["data"])
+
+
+@pytest.mark.asyncio
+async def test_users_invalid_size(aclient):
+    for size in (0, -1):
+        res = await aclient.get("/api/users", params={"size": size})
+        assert res.status_code == 422
+    # no upper bound
+    res = await aclient.get("/api/users", params={"size": 100000})
+    assert res.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_users_invalid_cursor(aclient):
+    res = await aclient.get("/api/users", params={"cursor": "not-a-cursor"})
+    print(f"{res.request.method} {res.url} >> {res.status_code} {res.text}")
+    assert res.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_users_export(aclient):
+    res = await aclient.post(
+        "/api/users/bulk",
+        content='{"email": "export@example.com", "name": "Zoë"}'.encode(),
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert res.json()["inserted"] == 1
+
+    res = await aclient.get("/api/users/export")
+    assert res.is_success
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    lines = res.text.splitlines()
+    assert lines
+    assert all(json.loads(line)["id"] for line in lines)
+    # the same bytes as the users in the JSON responses
+    (line,) = [l for l in res.content.splitlines() if b"export@example.com" in l]
+    res = await aclient.get("/api/users", params={"email_prefix": "export@"})
+    assert line in res.content
+
+    res = await aclient.get("/api/users/export", params={"format": "csv"})
+    assert res.is_success
+    assert res.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(res.text)))
+    assert rows[0] == ["id", "email", "name", "created_at", "updated_at"]
+    assert len(rows) - 1 == len(lines)
+
+
+@pytest.mark.asyncio
+async def test_users_bulk_ndjson(aclient):
+    async def _body():
+        # split across chunks in the middle of a line
+        yield b'{"email": "bulk+1@example.com", "name": "One"}\n{"email": "bu'
+        yield b'lk+2@example.com"}\n\nnot json\n{"email": "no-at-sign"}\n'
+        # already existing, seeded at startup
+        yield b'{"email": "user+1@example.com"}'
+
+    res = await aclient.post(
+        "/api/users/bulk",
+        content=_body(),
+        headers={"content-type": "application/x-ndjson"},
+    )
+    print(f"{res.request.method} {res.url} >> {res.status_code} {res.text}")
+    assert res.is_success
+    body = res.json()
+    assert body["received"] == 5
+    assert body["inserted"] == 2
+    assert body["duplicates"] == 1
+    assert body["failed"] == 2
+    assert [e["line"] for e in body["errors"]] == [4, 5]
+
+
+@pytest.mark.asyncio
+async def test_users_bulk_csv(aclient):
+    body = "email,name\r\nbulk+1@example.com,One\r\nbulk+2@example.com,\r\nbulk+3@example.com\r\n"
+    res = await aclient.post(
+        "/api/users/bulk", content=body, headers={"content-type": "text/csv"}
+    )
+    print(f"{res.request.method} {res.url} >> {res.status_code} {res.text}")
+    assert res.is_success
+    assert res.json()["inserted"] == 2
+    assert res.json()["errors"] == [{"line": 4, "error": "expected 2 values, got 1"}]
+
+    res = await aclient.post(
+        "/api/users/bulk", content="id,email\n", headers={"content-type": "text/csv"}
+    )
+    assert res.status_code == 400
+
+    res = await aclient.post(
+        "/api/users/bulk", content="{}", headers={"content-type": "application/json"}
+    )
+    assert res.status_code == 415
+
+
+@pytest.mark.asyncio
+async def test_user_by_id(aclient):
+    users = (await aclient.get("/api/users", params={"size": 20})).json()["data"]
+
+    async def _get(id):
+        return await aclient.get(f"/api/users/{id}")
+
+    def _batches():
+        return (
+            REGISTRY.get_sample_value(
+                "app_batch_loader_batch_size_count", {"loader": "users"}
+            )
+            or 0
+        )
+
+    # concurrent lookups are loaded together
+    batches_before = _batches()
+    responses = await asyncio.gather(*[_get(u["id"]) for u in users])
+    assert [r.json() for r in responses] == users
+    assert _batches() - batches_before < len(users)
+
+    res = await aclient.get(f"/api/users/{uuid.uuid4()}")
+    print(f"{res.request.method} {res.url} >> {res.status_code} {res.text}")
+    assert res.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_user_changes(app, aclient):
+    disconnect = asyncio.Event()
+    chunks = asyncio.Queue()
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+        elif message.get("body"):
+            await chunks.put(message["body"].decode())
+
+    async def _next_event() -> dict:
+        while True:
+            chunk = await asyncio.wait_for(chunks.get(), 5)
+            if chunk.startswith("id: "):
+                return json.loads(chunk.split("data: ")[1])
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/users/changes",
+        "raw_path": b"/api/users/changes",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"test")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+    stream = asyncio.create_task(app(scope, receive, send))
+    try:
+        assert await asyncio.wait_for(chunks.get(), 5) == "retry: 1000\n\n"
+        res = await aclient.post(
+            "/api/users/bulk",
+            content=b'{"email": "changes@example.com"}\n',
+            headers={"content-type": "application/x-ndjson"},
+        )
+        assert res.json()["inserted"] == 1
+        event = await _next_event()
+        assert event["table"] == "users" and event["op"] == "insert"
+        (user_id,) = event["ids"]
+        res = await aclient.get(f"/api/users/{user_id}")
+        assert res.json()["email"] == "changes@example.com"
+    finally:
+        disconnect.set()
+        await asyncio.wait_for(stream, 5)
+
+
+@pytest.mark.asyncio
+async def test_user_service_override(app, aclient):
+    class _FakeUserService:
+        async def get_user_row(self, id):
+            now = datetime.datetime(2024, 1, 1)
+            return id, "fake@example.com", None, now, now
+
+    id = uuid.uuid4()
+    with app.container.override(UserService, _FakeUserService()):
+        res = await aclient.get(f"/api/users/{id}")
+    assert res.status_code == 200
+    assert res.json()["email"] == "fake@example.com"
+    # the registered service is back once the override ends
+    assert (await aclient.get(f"/api/users/{id}")).status_code == 404
+
+
+def test_render_user_response_matches_user_response():
+    now = datetime.datetime.now()
+    rows = [
+        (uuid.uuid4(), "user+1@example.com", None, now, now),
+        (uuid.uuid4(), "user+2@example.com", "Zoë", now.replace(microsecond=0), now),
+    ]
+    expected = JSONResponse(
+        jsonable_encoder(
+            UserResponse(
+                elapsed=3,
+                size=2,
+                data=[UserDto(**dict(zip(UserDto.model_fields, r))) for r in rows],
+                next_cursor="abc",
+                total=42,
+                total_is_estimate=True,
+            )
+        )
+    )
+    actual = render_user_response(
+        rows, elapsed=3, size=2, next_cursor="abc", total=42, total_is_estimate=True
+    )
+    assert actual.body == expected.body
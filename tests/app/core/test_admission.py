@@ -0,0 +1,108 @@
+import asyncio
+
+import fastapi
+import httpx
+import pytest
+
+from app.core.admission import (
+    AdmissionConfig,
+    PrioritySemaphore,
+    setup_admission_control,
+)
+
+
+def _build_app(**config) -> fastapi.FastAPI:
+    app = fastapi.FastAPI()
+    setup_admission_control(app, AdmissionConfig(**config))
+    order = []
+    app.state.order = order
+
+    @app.get("/slow")
+    async def slow(name: str = "", delay: float = 0.05):
+        order.append(name)
+        await asyncio.sleep(delay)
+        return dict(message="ok")
+
+    @app.get("/fast")
+    async def fast(name: str = ""):
+        order.append(name)
+        return dict(message="ok")
+
+    @app.get("/api/health")
+    async def health():
+        return dict(status="up")
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_admission_control_queues_and_sheds():
+    app = _build_app(ADMISSION_MAX_CONCURRENCY=1, ADMISSION_MAX_QUEUE=2)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://x") as client:
+        responses = await asyncio.gather(*[client.get("/slow") for _ in range(5)])
+    status_codes = sorted(r.status_code for r in responses)
+    # one running, two queued, two rejected
+    assert status_codes == [200, 200, 200, 429, 429]
+    rejected = next(r for r in responses if r.status_code == 429)
+    assert rejected.headers["retry-after"] == "1"
+    assert rejected.json().get("message") == "too many requests"
+
+
+@pytest.mark.asyncio
+async def test_admission_control_deadline():
+    app = _build_app(ADMISSION_MAX_CONCURRENCY=1, ADMISSION_MAX_WAIT_MS=10)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://x") as client:
+        responses = await asyncio.gather(
+            client.get("/slow", params={"delay": 0.2}),
+            client.get("/slow"),
+        )
+    assert [r.status_code for r in responses] == [200, 429]
+
+
+@pytest.mark.asyncio
+async def test_admission_control_priorities():
+    app = _build_app(
+        ADMISSION_MAX_CONCURRENCY=1,
+        ADMISSION_ROUTE_PRIORITIES={"/slow": 1},
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://x") as client:
+        running = asyncio.create_task(client.get("/slow", params={"name": "running"}))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(client.get("/slow", params={"name": "queued"}))
+        await asyncio.sleep(0.01)
+        # /fast has the default priority 0, so it overtakes the queued /slow
+        await client.get("/fast", params={"name": "fast"})
+        await asyncio.gather(running, queued)
+    assert app.state.order == ["running", "fast", "queued"]
+
+
+@pytest.mark.asyncio
+async def test_admission_control_exempt_paths():
+    app = _build_app(ADMISSION_MAX_CONCURRENCY=1)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://x") as client:
+        running = asyncio.create_task(client.get("/slow", params={"delay": 0.2}))
+        await asyncio.sleep(0.01)
+        # health never queues, even if the only slot is taken
+        res = await asyncio.wait_for(client.get("/api/health"), timeout=0.1)
+        assert res.status_code == 200
+        await running
+
+
+@pytest.mark.asyncio
+async def test_priority_semaphore_cancel_racing_release():
+    semaphore = PrioritySemaphore(1)
+    await semaphore.acquire(0, timeout=1)
+    waiter = asyncio.create_task(semaphore.acquire(0, timeout=1))
+    await asyncio.sleep(0)
+    # the release pops the entry of the waiter before the waiter handles its cancellation
+    waiter.cancel()
+    semaphore.release()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert semaphore.queued == 0
+    # the slot is available again
+    await asyncio.wait_for(semaphore.acquire(0, timeout=1), 1)
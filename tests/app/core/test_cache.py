@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.core.cache import Cache, LocalCacheBackend
+
+
+@pytest.mark.asyncio
+async def test_local_backend_lru_size_bound():
+    backend = LocalCacheBackend(max_bytes=30)
+    await backend.set("ns:a", b"x" * 10, ttl=60)
+    await backend.set("ns:b", b"x" * 10, ttl=60)
+    # touch "a", so "b" is the least recently used
+    assert await backend.get("ns:a") is not None
+    await backend.set("ns:c", b"x" * 10, ttl=60)
+    assert await backend.get("ns:a") is not None
+    assert await backend.get("ns:b") is None
+    assert await backend.get("ns:c") is not None
+
+
+@pytest.mark.asyncio
+async def test_local_backend_ttl_and_invalidate():
+    backend = LocalCacheBackend(max_bytes=1024)
+    await backend.set("ns:expired", b"x", ttl=0)
+    await backend.set("ns:a", b"x", ttl=60)
+    await backend.set("other:a", b"x", ttl=60)
+    assert await backend.get("ns:expired") is None
+    await backend.invalidate("ns")
+    assert await backend.get("ns:a") is None
+    assert await backend.get("other:a") is not None
+
+
+@pytest.mark.asyncio
+async def test_cache_coalesces_concurrent_misses():
+    cache = Cache(LocalCacheBackend(max_bytes=1024), ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [1, 2, 3]
+
+    results = await asyncio.gather(
+        *[cache.get_or_load("ns", "key", loader) for _ in range(10)]
+    )
+    assert results == [[1, 2, 3]] * 10
+    assert calls == 1
+
+    assert await cache.get_or_load("ns", "key", loader) == [1, 2, 3]
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_does_not_store_loads_racing_an_invalidation():
+    cache = Cache(LocalCacheBackend(max_bytes=1024), ttl=60)
+
+    async def stale_loader():
+        await cache.invalidate("ns")
+        return "stale"
+
+    async def fresh_loader():
+        return "fresh"
+
+    assert await cache.get_or_load("ns", "key", stale_loader) == "stale"
+    assert await cache.get_or_load("ns", "key", fresh_loader) == "fresh"
+
+
+@pytest.mark.asyncio
+async def test_cache_load_error_is_not_cached():
+    cache = Cache(LocalCacheBackend(max_bytes=1024), ttl=60)
+
+    async def failing_loader():
+        raise RuntimeError("Oops...")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_load("ns", "key", failing_loader)
+
+    async def loader():
+        return "ok"
+
+    assert await cache.get_or_load("ns", "key", loader) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_cache_load_survives_the_cancellation_of_its_leader():
+    cache = Cache(LocalCacheBackend(max_bytes=1024), ttl=60)
+    loaded = asyncio.Event()
+
+    async def loader():
+        await loaded.wait()
+        return "ok"
+
+    leader = asyncio.create_task(cache.get_or_load("ns", "key", loader))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("ns", "key", loader))
+    await asyncio.sleep(0)
+    # e.g. the client of the leader disconnected
+    leader.cancel()
+    await asyncio.sleep(0)
+    loaded.set()
+    assert await waiter == "ok"
+    assert leader.cancelled()
+    assert await cache.backend.get("ns:key") is not None
@@ -0,0 +1,109 @@
+import zlib
+
+import brotli
+import httpx
+import pytest
+import zstandard
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.core.compression import (
+    CompressionConfig,
+    CompressionMiddleware,
+    negotiate_encoding,
+)
+
+_BODY = "".join(f"user+{i}@example.com\n" for i in range(1000))
+
+# streaming decompressors, by encoding
+_DECOMPRESSORS = {
+    "gzip": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS).decompress,
+    "br": lambda: brotli.Decompressor().process,
+    "zstd": lambda: zstandard.ZstdDecompressor().decompressobj().decompress,
+}
+
+
+def test_negotiate_encoding():
+    encodings = ["zstd", "br", "gzip"]
+    assert negotiate_encoding("gzip, deflate, br", encodings) == "br"
+    assert negotiate_encoding("br;q=0, gzip;q=0.5", encodings) == "gzip"
+    assert negotiate_encoding("*", encodings) == "zstd"
+    assert negotiate_encoding("identity", encodings) is None
+    assert negotiate_encoding("", encodings) is None
+
+
+def _create_client(**config) -> httpx.AsyncClient:
+    async def large(request):
+        return PlainTextResponse(_BODY)
+
+    async def small(request):
+        return PlainTextResponse("small")
+
+    app = Starlette(routes=[Route("/large", large), Route("/small", small)])
+    app.add_middleware(CompressionMiddleware, config=CompressionConfig(**config))
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://localhost"
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("offload_size", [0, 1024 * 1024])
+async def test_compression(offload_size):
+    async with _create_client(COMPRESSION_OFFLOAD_SIZE=offload_size) as client:
+        headers = {"accept-encoding": "gzip"}
+        res = await client.get("/large", headers=headers)
+        assert res.headers["content-encoding"] == "gzip"
+        assert res.headers["vary"] == "Accept-Encoding"
+        assert int(res.headers["content-length"]) < len(_BODY) / 4
+        assert res.text == _BODY
+
+        res = await client.get("/small", headers=headers)
+        assert "content-encoding" not in res.headers
+        assert res.text == "small"
+
+        res = await client.get("/large", headers={"accept-encoding": "identity"})
+        assert "content-encoding" not in res.headers
+        assert res.text == _BODY
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+async def test_compression_encodings(encoding):
+    headers = {"accept-encoding": f"{encoding}, identity;q=0.5"}
+    async with _create_client() as client:
+        async with client.stream("GET", "/large", headers=headers) as res:
+            assert res.headers["content-encoding"] == encoding
+            assert int(res.headers["content-length"]) < len(_BODY) / 4
+            # decompressed here, not to depend on the decoders of httpx
+            body = b"".join([c async for c in res.aiter_raw()])
+    assert _DECOMPRESSORS[encoding]()(body) == _BODY.encode()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+async def test_streaming_compression(encoding):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for line in _BODY.splitlines(keepends=True):
+            await send(
+                {"type": "http.response.body", "body": line.encode(), "more_body": True}
+            )
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", encoding.encode())]}
+    middleware = CompressionMiddleware(app, CompressionConfig())
+    await middleware(scope, None, send)
+
+    start, *chunks = messages
+    assert (b"content-encoding", encoding.encode()) in start["headers"]
+    decompress = _DECOMPRESSORS[encoding]()
+    # every line can be decompressed as soon as its chunk arrives
+    lines = [decompress(c["body"]) for c in chunks[:-1]]
+    assert lines == [line.encode() for line in _BODY.splitlines(keepends=True)]
+    assert decompress(chunks[-1]["body"]) == b""
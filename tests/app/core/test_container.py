@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from app.core.container import Container
+
+
+class _Service:
+    pass
+
+
+def test_register_and_get():
+    container = Container()
+    service = _Service()
+    container.register(_Service, service)
+    # the same instance for everyone
+    assert container.get(_Service) is service
+    assert container.get(_Service) is service
+    with pytest.raises(LookupError):
+        container.get(Container)
+
+
+@pytest.mark.asyncio
+async def test_override():
+    container = Container()
+    service = _Service()
+    container.register(_Service, service)
+    fake = _Service()
+
+    async def _get_overridden():
+        with container.override(_Service, fake):
+            await asyncio.sleep(0)
+            return container.get(_Service)
+
+    async def _get():
+        await asyncio.sleep(0)
+        return container.get(_Service)
+
+    # the override is scoped to its context, concurrent tasks do not see it
+    overridden, other = await asyncio.gather(_get_overridden(), _get())
+    assert overridden is fake
+    assert other is service
+    assert container.get(_Service) is service
@@ -0,0 +1,134 @@
+import asyncio
+
+import fastapi
+import httpx
+import pytest
+import sqlalchemy
+
+from app.core.deadline import DeadlineConfig, get_remaining_time, setup_deadline
+from app.core.error_handlers import setup_error_handlers
+from app.datalayer.instrumentation import InstrumentedDB
+
+
+def _create_app(db: InstrumentedDB, **config) -> fastapi.FastAPI:
+    app = fastapi.FastAPI()
+    setup_deadline(app, DeadlineConfig(**config))
+    setup_error_handlers(app)
+    app.state.sleeping = asyncio.Event()
+
+    @app.get("/remaining")
+    async def remaining():
+        return dict(remaining=get_remaining_time())
+
+    @app.get("/statement-timeout")
+    async def statement_timeout():
+        async with db.get_session() as session:
+            response = await session.execute(sqlalchemy.text("SHOW statement_timeout"))
+            return dict(statement_timeout=response.scalar_one())
+
+    @app.get("/sleep")
+    async def sleep(seconds: float):
+        async with db.get_session() as session:
+            app.state.sleeping.set()
+            await session.execute(sqlalchemy.text(f"SELECT pg_sleep({seconds})"))
+        return dict(message="awake")
+
+    return app
+
+
+async def _count_sleeping(db: InstrumentedDB) -> int:
+    query = "SELECT count(*) FROM pg_stat_activity WHERE query LIKE 'SELECT pg_sleep%'"
+    async with db.get_session() as session:
+        return (await session.execute(sqlalchemy.text(query))).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_deadline_from_header_and_routes(postgres_url):
+    db = InstrumentedDB(postgres_url)
+    app = _create_app(
+        db,
+        DEADLINE_DEFAULT_MS=1000,
+        DEADLINE_MAX_MS=2000,
+        DEADLINE_ROUTE_MS={"/remaining/long": 10000},
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        res = await client.get("/remaining")
+        assert 0.9 < res.json()["remaining"] <= 1
+        res = await client.get("/remaining", headers={"x-request-timeout-ms": "100"})
+        assert 0 < res.json()["remaining"] <= 0.1
+        # capped by DEADLINE_MAX_MS
+        res = await client.get("/remaining", headers={"x-request-timeout-ms": "5000"})
+        assert 1.9 < res.json()["remaining"] <= 2
+
+        res = await client.get("/sleep?seconds=0.01")
+        assert res.status_code == 200
+        res = await client.get(
+            "/sleep?seconds=5", headers={"x-request-timeout-ms": "200"}
+        )
+        assert res.status_code == 504
+        assert res.json()["message"] == "deadline exceeded"
+    # the statement was cancelled by the server, not left running
+    assert await _count_sleeping(db) == 0
+    await db.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect(postgres_url):
+    db = InstrumentedDB(postgres_url, pool_size=1, max_overflow=0)
+    app = _create_app(db)
+    disconnect = asyncio.Event()
+    messages = []
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/sleep",
+        "raw_path": b"/sleep",
+        "root_path": "",
+        "query_string": b"seconds=30",
+        "headers": [(b"host", b"test")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+    request = asyncio.create_task(app(scope, receive, send))
+    await asyncio.wait_for(app.state.sleeping.wait(), 5)
+    disconnect.set()
+    await asyncio.wait_for(request, 5)
+    assert messages == []
+
+    # the only connection of the pool was released, and its query cancelled
+    async with asyncio.timeout(5):
+        while await _count_sleeping(db):
+            await asyncio.sleep(0.05)
+    await db.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_statement_timeout_follows_the_deadline(postgres_url):
+    db = InstrumentedDB(postgres_url)
+    app = _create_app(db, DEADLINE_DEFAULT_MS=30000)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        # long deadlines too, e.g. the default one
+        res = await client.get("/statement-timeout")
+        assert res.json()["statement_timeout"] not in ("0", "30s")
+        res = await client.get(
+            "/statement-timeout", headers={"x-request-timeout-ms": "1000"}
+        )
+        assert res.json()["statement_timeout"].endswith("ms")
+    # outside of a request, the server's default
+    async with db.get_session() as session:
+        response = await session.execute(sqlalchemy.text("SHOW statement_timeout"))
+        assert response.scalar_one() == "0"
+    await db.engine.dispose()
@@ -3,7 +3,7 @@ import pytest
 from asgi_correlation_id import correlation_id
 from starlette.testclient import TestClient
 
-from app.core.correlation_id import setup_correlation_id
+from app.core.request_middleware import setup_request_middleware
 from app.core.error_handlers import setup_error_handlers
 
 
@@ -11,7 +11,7 @@ from app.core.error_handlers import setup_error_handlers
 def local_client():
     app = fastapi.FastAPI()
     setup_error_handlers(app)
-    setup_correlation_id(app)
+    setup_request_middleware(app)
 
     @app.get("/ok")
     def ok():
@@ -0,0 +1,36 @@
+import json
+import logging
+import queue
+import sys
+
+from app.core.logs import _DROPPED_RECORDS, _JsonFormatter, _QueueHandler
+
+
+def _make_record(msg: str, *args, exc_info=None) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, exc_info)
+
+
+def test_queue_handler_drops_when_full():
+    q = queue.Queue(maxsize=1)
+    handler = _QueueHandler(q, drop_on_full=True)
+    dropped = _DROPPED_RECORDS._value.get()
+    handler.handle(_make_record("first"))
+    handler.handle(_make_record("second"))
+    assert q.qsize() == 1
+    assert q.get_nowait().getMessage() == "first"
+    assert _DROPPED_RECORDS._value.get() == dropped + 1
+
+
+def test_queue_handler_prepares_records_for_json():
+    q = queue.Queue()
+    handler = _QueueHandler(q, drop_on_full=True)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        handler.handle(_make_record("hello %s", "world", exc_info=sys.exc_info()))
+    record = q.get_nowait()
+    assert record.exc_info is None
+    assert record.args is None
+    data = json.loads(_JsonFormatter().format(record))
+    assert data["message"] == "hello world"
+    assert "ValueError: boom" in data["exc_info"]
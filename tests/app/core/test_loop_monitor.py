@@ -0,0 +1,44 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from asgi_correlation_id import correlation_id
+from prometheus_client import REGISTRY
+
+from app.core.loop_monitor import LoopMonitor, LoopMonitorConfig
+
+
+def _blocking_call():
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor(caplog):
+    def _sample(name: str) -> float:
+        return REGISTRY.get_sample_value(name) or 0
+
+    lag_before = _sample("app_event_loop_lag_seconds_sum")
+    blocked_before = _sample("app_event_loop_blocked_total")
+    monitor = LoopMonitor(
+        LoopMonitorConfig(LOOP_MONITOR_INTERVAL_MS=10, LOOP_MONITOR_BLOCKED_MS=100)
+    )
+    await monitor.start()
+    try:
+
+        async def _request():
+            correlation_id.set("blocking-request")
+            _blocking_call()
+
+        with caplog.at_level(logging.WARNING, logger="app.core.loop_monitor"):
+            await asyncio.create_task(_request())
+            # the lag of the sample delayed by the blocking call
+            await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    assert _sample("app_event_loop_blocked_total") == blocked_before + 1
+    assert _sample("app_event_loop_lag_seconds_sum") - lag_before >= 0.2
+    (record,) = caplog.records
+    assert record.data["request_id"] == "blocking-request"
+    assert "_blocking_call" in record.getMessage()
@@ -1,12 +1,13 @@
 import fastapi
+from prometheus_client import REGISTRY
 from starlette.testclient import TestClient
 
-from app.core.correlation_id import setup_correlation_id
+from app.core.request_middleware import setup_request_middleware
 
 
 def test_request_context():
     app = fastapi.FastAPI()
-    setup_correlation_id(app)
+    setup_request_middleware(app)
 
     @app.get("/ok")
     def ok():
@@ -19,3 +20,62 @@ def test_request_context():
         )
         assert res.status_code == 200
         assert res.headers.get("x-request-id") == "001"
+
+
+def test_request_id_generated():
+    app = fastapi.FastAPI()
+    setup_request_middleware(app)
+
+    @app.get("/echo")
+    def echo(req: fastapi.Request):
+        return dict(request_id=req.headers.get("x-request-id"))
+
+    with TestClient(app) as client:
+        res = client.get("/echo")
+        assert res.status_code == 200
+        request_id = res.headers.get("x-request-id")
+        assert request_id
+        # handlers see the generated id in the request headers
+        assert res.json() == dict(request_id=request_id)
+        assert client.get("/echo").headers.get("x-request-id") != request_id
+
+
+def test_request_metrics():
+    app = fastapi.FastAPI()
+    setup_request_middleware(app)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        if item_id == 0:
+            raise RuntimeError("Oops...")
+        return dict(id=item_id)
+
+    @app.post("/echo")
+    async def echo(req: fastapi.Request):
+        return fastapi.Response(await req.body())
+
+    def _size(name: str, handler: str) -> float:
+        return REGISTRY.get_sample_value(f"{name}_sum", dict(handler=handler)) or 0
+
+    def _count(status: str, handler: str) -> float:
+        labels = dict(method="GET", status=status, handler=handler)
+        return REGISTRY.get_sample_value("http_requests_total", labels) or 0
+
+    ok_before = _count("2xx", "/items/{item_id}")
+    error_before = _count("5xx", "/items/{item_id}")
+    none_before = _count("4xx", "none")
+    request_size_before = _size("http_request_size_bytes", "/echo")
+    response_size_before = _size("http_response_size_bytes", "/echo")
+    with TestClient(app, raise_server_exceptions=False) as client:
+        assert client.get("/items/1").status_code == 200
+        assert client.get("/items/2").status_code == 200
+        assert client.get("/items/0").status_code == 500
+        assert client.get("/missing").status_code == 404
+        assert client.post("/echo", content=b"x" * 100).content == b"x" * 100
+    # labelled by route template, not by path
+    assert _count("2xx", "/items/{item_id}") == ok_before + 2
+    assert _count("5xx", "/items/{item_id}") == error_before + 1
+    assert _count("4xx", "none") == none_before + 1
+    # bytes of the bodies
+    assert _size("http_request_size_bytes", "/echo") == request_size_before + 100
+    assert _size("http_response_size_bytes", "/echo") == response_size_before + 100
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+import sqlalchemy
+from asgi_correlation_id import correlation_id
+
+from app.core.deadline import _deadline
+from app.core.request_middleware import _request_state
+from app.datalayer.batch_loader import BatchLoader
+from app.datalayer.instrumentation import InstrumentedDB
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_are_batched():
+    batches = []
+
+    async def load_many(keys):
+        batches.append(sorted(keys))
+        return {k: k * 10 for k in keys if k != 3}
+
+    loader = BatchLoader("test", load_many, max_batch_size=4)
+    results = await asyncio.gather(*[loader.load(k) for k in [1, 2, 2, 3, 4, 5]])
+    assert results == [10, 20, 20, None, 40, 50]
+    # the fourth distinct key fills the batch, the fifth starts a new one
+    assert batches == [[1, 2, 3, 4], [5]]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    async def load_many(keys):
+        raise RuntimeError("boom")
+
+    loader = BatchLoader("test", load_many)
+    results = await asyncio.gather(
+        loader.load(1), loader.load(2), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_memoized_loader():
+    calls = 0
+
+    async def load_many(keys):
+        nonlocal calls
+        calls += 1
+        return {k: k for k in keys}
+
+    memoized = BatchLoader("test", load_many).memoized()
+    assert await memoized.load(1) == 1
+    assert await memoized.load(1) == 1
+    assert calls == 1
+    memoized.clear()
+    assert await memoized.load(1) == 1
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_request_scoped_loader():
+    calls = 0
+
+    async def load_many(keys):
+        nonlocal calls
+        calls += 1
+        return {k: k for k in keys}
+
+    # built once, like the loader of the app-scoped UsersRepository
+    loader = BatchLoader("test", load_many).request_scoped()
+
+    async def _request():
+        _request_state.set({})
+        assert await loader.load(1) == 1
+        assert await loader.load(1) == 1
+
+    # every request (task) loads once, then reads its own memo
+    await asyncio.create_task(_request())
+    assert calls == 1
+    await asyncio.create_task(_request())
+    assert calls == 2
+    # outside of a request nothing is memoized
+    assert await loader.load(1) == 1
+    assert await loader.load(1) == 1
+    assert calls == 4
+
+
+@pytest.mark.asyncio
+async def test_batch_ignores_the_deadline_of_its_first_caller(postgres_url):
+    db = InstrumentedDB(postgres_url)
+
+    async def load_many(keys):
+        async with db.get_session() as session:
+            await session.execute(sqlalchemy.text("SELECT pg_sleep(0.05)"))
+        return {k: k for k in keys}
+
+    loader = BatchLoader("test", load_many)
+
+    async def _load(key: int, timeout: float | None):
+        if timeout is not None:
+            _deadline.set(asyncio.get_running_loop().time() + timeout)
+        return await loader.load(key)
+
+    # the first caller starts the batch, with a deadline shorter than the query
+    results = await asyncio.gather(
+        _load(1, 0.01), *[_load(k, None) for k in range(2, 6)]
+    )
+    assert results == [1, 2, 3, 4, 5]
+    await db.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_batch_runs_with_the_request_id_of_its_first_caller():
+    request_ids = []
+
+    async def load_many(keys):
+        # e.g. in the slow query logs
+        request_ids.append(correlation_id.get())
+        return {k: k for k in keys}
+
+    loader = BatchLoader("test", load_many)
+
+    async def _load(key: int, request_id: str):
+        correlation_id.set(request_id)
+        return await loader.load(key)
+
+    assert await asyncio.gather(_load(1, "first"), _load(2, "second")) == [1, 2]
+    assert request_ids == ["first"]
@@ -0,0 +1,128 @@
+import asyncio
+
+import asyncpg
+import pytest
+import sqlalchemy
+
+from app.core.cache import Cache, LocalCacheBackend
+from app.datalayer.change_feed import (
+    ChangeEvent,
+    ChangeFeed,
+    ChangeFeedConfig,
+    ChangeSubscription,
+)
+from app.datalayer.facade import DatalayerFacade
+
+
+async def _next(subscription: ChangeSubscription) -> ChangeEvent:
+    return await asyncio.wait_for(subscription.get(), 5)
+
+
+async def _get_page(facade: DatalayerFacade) -> list[tuple]:
+    _, rows = await facade.users.get_page_with_version(10)
+    return rows
+
+
+@pytest.mark.asyncio
+async def test_change_feed(facade: DatalayerFacade):
+    feed = ChangeFeed(facade.db, ChangeFeedConfig(CHANGE_FEED_RECONNECT_SECONDS=0.01))
+    await feed.start(timeout=5)
+    try:
+        assert feed.is_connected
+        with feed.subscribe(["users"]) as subscription:
+            await facade.users.insert_many([dict(email="feed@example.com")])
+            event = await _next(subscription)
+            assert event.table == "users" and event.op == "insert"
+            (user_id,) = event.ids
+            assert feed.get_version("users") == event.version
+
+            await facade.users.update_by_id(user_id, dict(name="Feed"))
+            event = await _next(subscription)
+            assert (event.op, event.ids) == ("update", (user_id,))
+
+            # too many ids for a notification
+            await facade.users.bulk_insert(
+                (f"feed+{i}@example.com",) for i in range(101)
+            )
+            event = await _next(subscription)
+            assert (event.op, event.ids) == ("insert", None)
+
+            async with facade.db.get_session() as session:
+                await session.execute(sqlalchemy.text("TRUNCATE users"))
+            event = await _next(subscription)
+            assert (event.op, event.ids) == ("truncate", None)
+            assert event.version == feed.get_version("users")
+    finally:
+        await feed.stop()
+
+
+@pytest.mark.asyncio
+async def test_change_feed_resync(facade: DatalayerFacade):
+    feed = ChangeFeed(facade.db, ChangeFeedConfig(CHANGE_FEED_RECONNECT_SECONDS=0.01))
+    await feed.start(timeout=5)
+    try:
+        with feed.subscribe(["users"]) as subscription:
+            # changes not notified
+            async with facade.db.get_session() as session:
+                await session.execute(
+                    sqlalchemy.text(
+                        "ALTER TABLE users DISABLE TRIGGER users_notify_inserted"
+                    )
+                )
+            await facade.users.insert_many([dict(email="gap+1@example.com")])
+            async with facade.db.get_session() as session:
+                await session.execute(
+                    sqlalchemy.text(
+                        "ALTER TABLE users ENABLE TRIGGER users_notify_inserted"
+                    )
+                )
+            await facade.users.insert_many([dict(email="gap+2@example.com")])
+            assert await _next(subscription) == ChangeEvent("users", "resync")
+            assert (await _next(subscription)).op == "insert"
+
+            # the listening connection is lost
+            conn = await asyncpg.connect(facade.db.postgres_url)
+            try:
+                await conn.execute(
+                    "SELECT pg_terminate_backend(pid) FROM pg_stat_activity"
+                    " WHERE datname = current_database() AND pid <> pg_backend_pid()"
+                    " AND query IN ('SELECT table_name, version FROM table_versions', 'SELECT 1')"
+                )
+            finally:
+                await conn.close()
+            assert await _next(subscription) == ChangeEvent(None, "resync")
+            assert feed.is_connected
+            await facade.users.insert_many([dict(email="gap+3@example.com")])
+            assert (await _next(subscription)).op == "insert"
+    finally:
+        await feed.stop()
+
+
+@pytest.mark.asyncio
+async def test_change_feed_invalidates_cache(facade: DatalayerFacade):
+    # another process, with its own cache
+    cache = Cache(LocalCacheBackend(max_bytes=1024 * 1024), ttl=3600)
+    other = DatalayerFacade(facade.db, cache)
+    feed = ChangeFeed(facade.db, ChangeFeedConfig())
+    feed.add_listener(other.users.on_change)
+    await feed.start(timeout=5)
+    try:
+        with feed.subscribe() as subscription:
+            assert await _get_page(other) == []
+            await facade.users.insert_many([dict(email="cached@example.com")])
+            await _next(subscription)
+            # listeners run in the background, once the event is published
+            async with asyncio.timeout(5):
+                while not await _get_page(other):
+                    await asyncio.sleep(0.01)
+    finally:
+        await feed.stop()
+
+
+@pytest.mark.asyncio
+async def test_subscription_overflow():
+    subscription = ChangeSubscription(None, max_size=2)
+    subscription.publish(ChangeEvent("users", "insert", 1, ()))
+    subscription.publish(ChangeEvent("users", "insert", 2, ()))
+    subscription.publish(ChangeEvent("users", "insert", 3, ()))
+    assert await subscription.get() == ChangeEvent(None, "resync")
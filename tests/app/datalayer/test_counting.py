@@ -0,0 +1,47 @@
+import pytest
+import sqlalchemy
+
+from app.datalayer.counting import CountStrategy, RowCount
+from app.datalayer.facade import DatalayerFacade
+from app.datalayer.users import UsersFilters, UsersRecord
+
+
+@pytest.mark.asyncio
+async def test_counter_follows_writes(facade: DatalayerFacade):
+    async def _count() -> RowCount:
+        return await facade.users.count_users(CountStrategy.COUNTER)
+
+    assert await _count() == RowCount(0, is_estimate=False)
+    await facade.users.bulk_insert((f"count+{i}@example.com",) for i in range(100))
+    await facade.users.insert_many([dict(email="count+100@example.com")])
+    assert await _count() == RowCount(101, is_estimate=False)
+
+    where = UsersFilters(email_prefix="count+1").to_where_clauses()
+    async with facade.db.get_session() as session:
+        await session.execute(sqlalchemy.delete(UsersRecord).where(*where))
+    # count+1, count+10 to count+19 and count+100
+    assert await _count() == RowCount(101 - 12, is_estimate=False)
+    assert await facade.users.count_users(CountStrategy.EXACT) == await _count()
+
+    async with facade.db.get_session() as session:
+        await session.execute(sqlalchemy.text("TRUNCATE users"))
+    assert await _count() == RowCount(0, is_estimate=False)
+
+
+@pytest.mark.asyncio
+async def test_estimate(facade: DatalayerFacade):
+    await facade.users.bulk_insert((f"estimate+{i}@example.com",) for i in range(1000))
+    async with facade.db.get_session() as session:
+        await session.execute(sqlalchemy.text("ANALYZE users"))
+
+    total, is_estimate = await facade.users.count_users(CountStrategy.ESTIMATE)
+    assert is_estimate
+    assert total == 1000
+
+    filters = UsersFilters(email_prefix="estimate+1")
+    total, is_estimate = await facade.users.count_users(CountStrategy.COUNTER, filters)
+    # the counter cannot count a subset, it falls back to the estimate
+    assert is_estimate
+    assert 1 <= total <= 1000
+    exact = await facade.users.count_users(CountStrategy.EXACT, filters)
+    assert exact == RowCount(111, is_estimate=False)
@@ -0,0 +1,48 @@
+import logging
+
+import pytest
+from asyncpg_datalayer.migrationtool.main import apply_migrations
+from prometheus_client import REGISTRY
+
+from app import migrations_dir
+from app.datalayer.facade import DatalayerFacade
+from app.datalayer.instrumentation import InstrumentedDB, get_fingerprint
+
+
+def test_get_fingerprint():
+    assert get_fingerprint("SELECT 1") == "SELECT"
+    assert (
+        get_fingerprint("SELECT users.id, users.email \nFROM users WHERE users.id = $1")
+        == "SELECT users"
+    )
+    assert get_fingerprint("INSERT INTO users (email) VALUES ($1)") == "INSERT users"
+    assert get_fingerprint("update users SET name=$1") == "UPDATE users"
+    assert get_fingerprint('DELETE FROM "users"') == "DELETE users"
+
+
+@pytest.mark.asyncio
+async def test_slow_queries_are_logged(postgres_url, caplog):
+    await apply_migrations(postgres_url, migrations_dir)
+    db = InstrumentedDB(postgres_url, slow_query_ms=0)
+    count_before = (
+        REGISTRY.get_sample_value(
+            "app_db_query_seconds_count", {"statement": "SELECT users"}
+        )
+        or 0
+    )
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.sql.slow"):
+            await DatalayerFacade(db).users.get_distinct_emails()
+    finally:
+        await db.disconnect()
+
+    assert (
+        REGISTRY.get_sample_value(
+            "app_db_query_seconds_count", {"statement": "SELECT users"}
+        )
+        == count_before + 1
+    )
+    assert REGISTRY.get_sample_value("app_db_pool_acquire_seconds_count") >= 1
+    record = next(r for r in caplog.records if r.name == "app.sql.slow")
+    assert record.data["fingerprint"] == "SELECT users"
+    assert record.data["statement"].startswith("SELECT DISTINCT users.email FROM users")
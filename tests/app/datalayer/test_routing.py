@@ -0,0 +1,131 @@
+import asyncio
+import uuid
+
+import pytest
+import pytest_asyncio
+from asyncpg_datalayer.migrationtool.main import apply_migrations
+
+from app import migrations_dir
+from app.core.cache import Cache, LocalCacheBackend
+from app.datalayer.batch_loader import BatchLoader
+from app.datalayer.facade import DatalayerFacade
+from app.datalayer.routing import ReplicaConfig, RoutingDB, _pinned_to_primary
+
+
+@pytest_asyncio.fixture
+async def routing_db(postgres_url, replica_url):
+    await apply_migrations(postgres_url, migrations_dir)
+    await apply_migrations(replica_url, migrations_dir)
+    db = RoutingDB(postgres_url, [replica_url], ReplicaConfig())
+    await db.start()
+    # the test replica does not replicate, so the data written to each database tells where reads went
+    await db.replicas[0].db.exec_dml(
+        "INSERT INTO users (email) VALUES ('replica@example.com')"
+    )
+    yield db
+    await db.stop()
+    await db.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_readonly_sessions_go_to_replicas(routing_db):
+    facade = DatalayerFacade(routing_db)
+    token = _pinned_to_primary.set(False)
+    try:
+        assert routing_db.replicas[0].lag == 0
+        assert await facade.users.get_distinct_emails() == ["replica@example.com"]
+
+        # read-your-writes: after a write, reads go to the primary
+        await facade.users.bulk_insert([("primary@example.com",)])
+        assert await facade.users.get_distinct_emails() == ["primary@example.com"]
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+@pytest.mark.asyncio
+async def test_lagging_replicas_fall_back_to_primary(routing_db):
+    facade = DatalayerFacade(routing_db)
+    await routing_db.exec_dml(
+        "INSERT INTO users (email) VALUES ('primary@example.com')"
+    )
+    token = _pinned_to_primary.set(False)
+    try:
+        routing_db.replicas[0].lag = routing_db.config.REPLICA_MAX_LAG_SECONDS + 1
+        assert await facade.users.get_distinct_emails() == ["primary@example.com"]
+
+        # unknown lag, e.g. the replica is down
+        routing_db.replicas[0].lag = None
+        assert await facade.users.get_distinct_emails() == ["primary@example.com"]
+
+        await routing_db.check_replicas()
+        assert await facade.users.get_distinct_emails() == ["replica@example.com"]
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+@pytest.mark.asyncio
+async def test_page_and_version_read_from_the_same_db(postgres_url, replica_url):
+    await apply_migrations(postgres_url, migrations_dir)
+    await apply_migrations(replica_url, migrations_dir)
+    # reads alternate between the two, which have different users and versions
+    db = RoutingDB(postgres_url, [replica_url, postgres_url], ReplicaConfig())
+    await db.start()
+    try:
+        await db.replicas[0].db.exec_dml(
+            "INSERT INTO users (email) VALUES ('replica@example.com')"
+        )
+        facade = DatalayerFacade(db)
+        token = _pinned_to_primary.set(False)
+        try:
+            assert len(db.get_available_replicas()) == 2
+            for _ in range(4):
+                version, rows = await facade.users.get_page_with_version(10)
+                assert version.version == len(rows)
+        finally:
+            _pinned_to_primary.reset(token)
+    finally:
+        await db.stop()
+        await db.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_cached_pages_are_read_from_the_primary(routing_db):
+    cache = Cache(LocalCacheBackend(max_bytes=1024 * 1024), ttl=3600)
+    facade = DatalayerFacade(routing_db, cache)
+    token = _pinned_to_primary.set(False)
+    try:
+        # a request writes, then another one reads, before the replica caught up
+        await asyncio.create_task(
+            facade.users.insert(dict(email="primary@example.com"))
+        )
+        _, rows = await facade.users.get_page_with_version(10)
+        assert [r[1] for r in rows] == ["primary@example.com"]
+        # reads not cached still go to the replica
+        assert await facade.users.get_distinct_emails() == ["replica@example.com"]
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+@pytest.mark.asyncio
+async def test_batch_loads_read_from_the_primary_when_a_caller_is_pinned(routing_db):
+    # the same user, as written on the primary and as still found on the replica
+    user_id = uuid.uuid4()
+    for db, email in [
+        (routing_db, "written@example.com"),
+        (routing_db.replicas[0].db, "stale@example.com"),
+    ]:
+        await db.exec_dml(
+            f"INSERT INTO users (id, email) VALUES ('{user_id}', '{email}')"
+        )
+    loader = BatchLoader("users", DatalayerFacade(routing_db).users.get_rows_by_ids)
+
+    async def _load(pinned: bool) -> str:
+        _pinned_to_primary.set(pinned)
+        return (await loader.load(user_id))[1]
+
+    # in the same batch, one caller has written
+    assert await asyncio.gather(_load(False), _load(True)) == [
+        "written@example.com",
+        "written@example.com",
+    ]
+    assert await asyncio.create_task(_load(False)) == "stale@example.com"
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from app.core.cache import Cache, LocalCacheBackend
+from app.datalayer.facade import DatalayerFacade
+
+
+@pytest.mark.asyncio
+async def test_bulk_insert_skips_existing_emails(facade: DatalayerFacade):
+    rows = [(f"bulk+{i}@example.com",) for i in range(100)]
+    assert await facade.users.bulk_insert(iter(rows)) == 100
+
+    # duplicates, both against the table and within the same load, are skipped
+    rows = [(f"bulk+{i}@example.com",) for i in range(50, 150)] * 2
+    assert await facade.users.bulk_insert(iter(rows)) == 50
+
+    emails = await facade.users.get_distinct_emails()
+    assert len(emails) == 150
+
+
+@pytest.mark.asyncio
+async def test_get_page_with_version(facade: DatalayerFacade):
+    await facade.users.bulk_insert((f"page+{i}@example.com",) for i in range(25))
+
+    version, first_page = await facade.users.get_page_with_version(size=10)
+    assert version.row_count == 25
+    assert len(first_page) == 10
+    last_id, _, _, last_created_at, _ = first_page[-1]
+    _, second_page = await facade.users.get_page_with_version(
+        size=100, after=(last_created_at, last_id)
+    )
+    assert len(second_page) == 15
+    assert {r[0] for r in first_page}.isdisjoint({r[0] for r in second_page})
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_the_cache(db):
+    cache = Cache(LocalCacheBackend(max_bytes=1024 * 1024), ttl=3600)
+    users = DatalayerFacade(db, cache).users
+
+    async def _emails() -> list[str]:
+        _, rows = await users.get_page_with_version(100)
+        return sorted(f"{r[1]}:{r[2]}" for r in rows)
+
+    async def _assert_invalidated(write) -> None:
+        before = await _emails()
+        # cached
+        assert await _emails() == before
+        await write
+        assert await _emails() != before
+
+    id_1 = await users.insert(dict(email="cached+1@example.com"))
+    await _assert_invalidated(users.insert(dict(email="cached+2@example.com")))
+    await _assert_invalidated(users.insert_many([dict(email="cached+3@example.com")]))
+    await _assert_invalidated(users.insert_multikey(dict(email="cached+4@example.com")))
+    await _assert_invalidated(
+        users.insert_many_multikey([dict(email="cached+5@example.com")])
+    )
+    await _assert_invalidated(users.update_by_id(id_1, dict(name="one")))
+    await _assert_invalidated(
+        users.update_many(dict(name="many"), dict(email="cached+2@example.com"))
+    )
+    await _assert_invalidated(users.delete_by_id(id_1))
+    ids = await users.insert_many([dict(email="cached+6@example.com")])
+    await _assert_invalidated(users.delete_by_ids(set(ids)))
+    await _assert_invalidated(users.delete_many(dict(email="cached+2@example.com")))
+
+
+@pytest.mark.asyncio
+async def test_writes_in_the_callers_session_invalidate_on_commit(db):
+    cache = Cache(LocalCacheBackend(max_bytes=1024 * 1024), ttl=3600)
+    users = DatalayerFacade(db, cache).users
+
+    async with db.get_session() as session:
+        await users.insert(dict(email="session@example.com"), reuse_session=session)
+        # read, and cached, by another session before the commit
+        _, rows = await users.get_page_with_version(100)
+        assert rows == []
+    # the invalidation is scheduled by the commit
+    await asyncio.sleep(0)
+    _, rows = await users.get_page_with_version(100)
+    assert [r[1] for r in rows] == ["session@example.com"]
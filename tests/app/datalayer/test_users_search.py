@@ -0,0 +1,108 @@
+import datetime
+
+import pytest
+import sqlalchemy
+
+from app.datalayer.asyncpg_utils import get_asyncpg_connection
+from app.datalayer.facade import DatalayerFacade
+from app.datalayer.users import UsersFilters, UsersRepository
+
+_BASE = datetime.datetime(2024, 1, 1)
+
+
+async def _insert_users(facade: DatalayerFacade, count: int) -> None:
+    # one user per second, updated one hour after creation, appended in creation order
+    async with facade.db.get_session() as session:
+        await session.execute(
+            sqlalchemy.text(
+                "INSERT INTO users (email, name, created_at, updated_at)"
+                " SELECT 'user+' || i || '@example.com', 'Name ' || md5(i::text),"
+                " :base + i * interval '1 second', :base + i * interval '1 second' + interval '1 hour'"
+                " FROM generate_series(1, :count) i"
+            ).bindparams(base=_BASE, count=count)
+        )
+
+
+def _plan_nodes(plan: dict) -> list[dict]:
+    return [plan, *(n for p in plan.get("Plans", []) for n in _plan_nodes(p))]
+
+
+@pytest.mark.asyncio
+async def test_filters(facade: DatalayerFacade):
+    await _insert_users(facade, 100)
+    await facade.users.insert_many(
+        [dict(email="50%_off@example.com", name="Zoë Smith")]
+    )
+
+    async def _emails(**filters) -> list[str]:
+        _, rows = await facade.users.get_page_with_version(
+            100, filters=UsersFilters(**filters)
+        )
+        return [r[1] for r in rows]
+
+    assert await _emails(email_prefix="user+10") == [
+        "user+10@example.com",
+        "user+100@example.com",
+    ]
+    # LIKE wildcards are matched literally
+    assert await _emails(email_prefix="50%_") == ["50%_off@example.com"]
+    assert await _emails(email_prefix="5%") == []
+    assert await _emails(name_contains="zoë SMI") == ["50%_off@example.com"]
+    # ranges are half-open
+    assert await _emails(
+        created_from=_BASE + datetime.timedelta(seconds=10),
+        created_to=_BASE + datetime.timedelta(seconds=12),
+    ) == ["user+10@example.com", "user+11@example.com"]
+    assert await _emails(
+        updated_from=_BASE + datetime.timedelta(hours=1, seconds=99),
+        updated_to=_BASE + datetime.timedelta(hours=2),
+    ) == ["user+99@example.com", "user+100@example.com"]
+    # time zone aware bounds are compared in UTC
+    cet = datetime.timezone(datetime.timedelta(hours=1))
+    assert await _emails(
+        created_from=datetime.datetime(2024, 1, 1, 1, 1, 39, tzinfo=cet),
+        created_to=datetime.datetime(2024, 1, 1, 1, 1, 41, tzinfo=cet),
+    ) == ["user+99@example.com", "user+100@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_filters_use_indexes(facade: DatalayerFacade):
+    await _insert_users(facade, 1_000_000)
+    async with facade.db.get_session() as session:
+        conn = await get_asyncpg_connection(session)
+        # summarizes the BRIN ranges, like autovacuum would, and collects the statistics
+        await conn.execute("COMMIT")
+        await conn.execute("VACUUM ANALYZE users")
+        has_trigram_index = await conn.fetchval(
+            "SELECT 1 FROM pg_indexes WHERE indexname = 'users_name_trgm_idx'"
+        )
+
+    cases = {
+        "users_email_pattern_idx": UsersFilters(email_prefix="user+12345"),
+        "users_created_at_id_idx": UsersFilters(
+            created_from=_BASE + datetime.timedelta(days=3),
+            created_to=_BASE + datetime.timedelta(days=3, hours=1),
+        ),
+        "users_updated_at_brin_idx": UsersFilters(
+            updated_from=_BASE + datetime.timedelta(days=3),
+            updated_to=_BASE + datetime.timedelta(days=3, hours=1),
+        ),
+    }
+    if has_trigram_index:
+        # pg_trgm is a contrib module, not every server has it
+        cases["users_name_trgm_idx"] = UsersFilters(name_contains="abcdef")
+
+    for index, filters in cases.items():
+        query = UsersRepository.get_page_query(101, filters=filters)
+        compiled = query.compile(dialect=facade.db.engine.dialect)
+        params = [compiled.params[k] for k in compiled.positiontup]
+        async with facade.db.get_session(readonly=True) as session:
+            conn = await get_asyncpg_connection(session)
+            plan = await conn.fetchval(
+                f"EXPLAIN (FORMAT JSON) {compiled.string}", *params
+            )
+        # the json codec of the connection has already decoded the plan
+        nodes = _plan_nodes(plan[0]["Plan"])
+        print(f"{index}: {[(n['Node Type'], n.get('Index Name')) for n in nodes]}")
+        assert not any(n["Node Type"] == "Seq Scan" for n in nodes)
+        assert index in {n.get("Index Name") for n in nodes}
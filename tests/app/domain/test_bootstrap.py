@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+from asyncpg_datalayer.db import DB
+
+from app.core.startup import StartupTimer
+from app.datalayer.facade import DatalayerFacade
+from app.domain.bootstrap import bootstrap
+from tests.testutils.mock_environ import mock_environ
+
+
+@pytest.mark.asyncio
+async def test_concurrent_bootstrap(postgres_url):
+    dbs = [DB(postgres_url), DB(postgres_url)]
+    try:
+        with mock_environ(APP_SEED_SIZE="100"):
+            # the advisory lock makes concurrent runs wait for each other instead of racing on the migrations
+            await asyncio.gather(*[bootstrap(db) for db in dbs])
+        emails = await DatalayerFacade(dbs[0]).users.get_distinct_emails()
+        assert len(emails) == 100
+    finally:
+        for db in dbs:
+            await db.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_skips_when_up_to_date(postgres_url):
+    db = DB(postgres_url)
+    try:
+        with mock_environ(APP_SEED_SIZE="100"):
+            first = StartupTimer()
+            await bootstrap(db, first)
+            assert {"migrations", "seed"} <= first.phases.keys()
+
+            second = StartupTimer()
+            await bootstrap(db, second)
+            # a single query, no lock, no migrations, no seed
+            assert second.phases.keys() == {"bootstrap_check"}
+
+        # a different seed size seeds again, the migrations are still up to date
+        with mock_environ(APP_SEED_SIZE="150"):
+            third = StartupTimer()
+            await bootstrap(db, third)
+            assert "migrations" not in third.phases
+            assert "seed" in third.phases
+        emails = await DatalayerFacade(db).users.get_distinct_emails()
+        assert len(emails) == 150
+    finally:
+        await db.disconnect()
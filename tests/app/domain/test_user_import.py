@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.domain.user_import import UserImporter, iter_lines, prefetch
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_iter_lines():
+    chunks = [b"a\r\nb", b"c\n", b"", b"\nd"]
+    assert [line async for line in iter_lines(_aiter(chunks))] == [
+        b"a",
+        b"bc",
+        b"",
+        b"d",
+    ]
+
+    with pytest.raises(ValueError):
+        async for _ in iter_lines(_aiter([b"x" * 10, b"x" * 10]), max_line_bytes=15):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_importer_batches():
+    importer = UserImporter("ndjson", max_errors=1)
+    lines = [f'{{"email": "user+{i}@example.com"}}'.encode() for i in range(5)]
+    lines += [b"{}", b"[]"]
+    batches = [b async for b in importer.iter_batches(_aiter(lines), batch_size=2)]
+    assert [len(b) for b in batches] == [2, 2, 1]
+    assert batches[0][0] == ("user+0@example.com", None)
+    assert importer.received == 7
+    assert importer.failed == 2
+    assert len(importer.errors) == 1
+
+
+@pytest.mark.asyncio
+async def test_prefetch_runs_ahead():
+    produced = []
+
+    async def _produce():
+        for i in range(3):
+            produced.append(i)
+            yield i
+
+    items = prefetch(_produce(), size=1)
+    assert await anext(items) == 0
+    await asyncio.sleep(0)
+    # the next item is produced while the consumer is busy with the first one
+    assert produced == [0, 1, 2]
+    assert [i async for i in items] == [1, 2]
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from tests.testutils.mock_environ import mock_environ
+
+
+@pytest.fixture
+def env_vars(postgres_url):
+    with mock_environ(
+        dotenv_file=".env.test",
+        POSTGRES_URL=postgres_url,
+        POOL_SIZE="5",
+        POOL_MAX_OVERFLOW="0",
+        ADMISSION_MAX_CONCURRENCY="2",
+    ):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_admission_control_queues_bursts(app, aclient):
+
+    async def _get():
+        return (await aclient.get(f"/api/users")).status_code
+
+    # requests beyond the concurrency limit wait for a slot instead of failing
+    status_codes = await asyncio.gather(*[_get() for _ in range(20)])
+    assert set(status_codes) == {200}
+    # and never more than 2 connections were needed
+    assert app.db.engine.pool.checkedin() <= 2
@@ -17,6 +17,17 @@ async def test_health(aclient):
     assert res.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_health_deep(aclient):
+    res = await aclient.get("/api/health", params={"deep": True})
+    print(f"{res.request.method} {res.url} >> {res.status_code} {res.text}")
+    assert res.status_code == 200
+    report = res.json()
+    assert report["status"] == "up"
+    assert report["db"]["up"]
+    assert report["pool"]["in_use"] >= 1
+
+
 @pytest.mark.asyncio
 async def test_docs_not_found(aclient):
     res = await aclient.get("/api/docs")
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from app.serve import get_cpu_quota, get_worker_count, split_pool_budget
+
+
+def test_split_pool_budget():
+    # two connections per worker are kept for the health monitor and the change feed
+    assert split_pool_budget(40, 4) == 8
+    assert split_pool_budget(10, 3) == 1
+    with pytest.raises(ValueError):
+        split_pool_budget(8, 4)
+
+
+def test_get_cpu_quota(tmp_path):
+    cpu_max = tmp_path / "cpu.max"
+    assert get_cpu_quota(str(cpu_max)) is None
+    cpu_max.write_text("max 100000\n")
+    assert get_cpu_quota(str(cpu_max)) is None
+    cpu_max.write_text("200000 100000\n")
+    assert get_cpu_quota(str(cpu_max)) == 2
+    cpu_max.write_text("50000 100000\n")
+    assert get_cpu_quota(str(cpu_max)) == 1
+
+
+def test_get_worker_count(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert get_worker_count(80) == 3
+    monkeypatch.delenv("WEB_CONCURRENCY")
+    assert 1 <= get_worker_count(80) <= os.process_cpu_count()
+
+
+def test_get_worker_count_many_cores(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setattr(os, "process_cpu_count", lambda: 64)
+    monkeypatch.setattr("app.serve.get_cpu_quota", lambda: None)
+    # capped, so that the default budget still gives each worker a pool connection
+    workers = get_worker_count(80)
+    assert workers == 26
+    assert split_pool_budget(80, workers) == 1
+    assert get_worker_count(2) == 1
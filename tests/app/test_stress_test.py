@@ -18,6 +18,8 @@ def env_vars(postgres_url):
         POOL_SIZE="5",
         POOL_MAX_OVERFLOW="0",
         POOL_TIMEOUT="0",
+        # Let requests reach the pool, to check that overflow is turned into 429.
+        ADMISSION_ENABLED="0",
     ):
         yield
 
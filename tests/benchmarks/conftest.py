@@ -0,0 +1,21 @@
+import os
+import pathlib
+
+import pytest
+
+from tests.testutils.benchmark import BenchmarkReport
+
+
+@pytest.fixture(scope="session")
+def benchmark_report():
+    baseline = os.getenv("BENCHMARK_BASELINE")
+    max_regression = os.getenv("BENCHMARK_MAX_REGRESSION")
+    report = BenchmarkReport(
+        output_dir=pathlib.Path(os.getenv("BENCHMARK_OUTPUT_DIR") or ".benchmarks"),
+        baseline_file=pathlib.Path(baseline) if baseline else None,
+        max_regression=float(max_regression) if max_regression else None,
+    )
+    yield report
+    path = report.save()
+    if path is not None:
+        print(f"Benchmark results saved to {path}")
@@ -0,0 +1,114 @@
+import itertools
+
+import pytest
+from asyncpg_datalayer.db import DB
+from asyncpg_datalayer.migrationtool.main import apply_migrations
+
+from app import migrations_dir
+from app.datalayer.facade import DatalayerFacade
+from app.datalayer.users import UsersRecordInsert
+from app.domain.create_some_data import create_some_data
+from tests.testutils.benchmark import BENCHMARK_ENABLED, run_load
+from tests.testutils.mock_environ import mock_environ
+
+pytestmark = pytest.mark.skipif(
+    not BENCHMARK_ENABLED, reason="set BENCHMARK=1 to run the benchmarks"
+)
+
+_SEED_SIZE = 10000
+_REQUESTS = 200
+
+
+@pytest.fixture
+def env_vars(postgres_url):
+    with mock_environ(
+        dotenv_file=".env.test",
+        POSTGRES_URL=postgres_url,
+        # SQL and request logs would dominate the measurements
+        LOG_SQL="0",
+        LOG_LEVEL="WARNING",
+        APP_SEED_SIZE=str(_SEED_SIZE),
+        POOL_SIZE="10",
+        POOL_MAX_OVERFLOW="10",
+    ):
+        yield
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [10, 100, 1000])
+@pytest.mark.parametrize("concurrency", [1, 10, 50])
+async def test_get_users(aclient, benchmark_report, size, concurrency):
+    async def _get():
+        res = await aclient.get("/api/users", params={"size": size})
+        return res.status_code == 200
+
+    result = await run_load(
+        f"GET /api/users?size={size}[c={concurrency}]", _get, _REQUESTS, concurrency
+    )
+    benchmark_report.add(result)
+    assert result.errors == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("deep", [False, True])
+@pytest.mark.parametrize("concurrency", [1, 50])
+async def test_health(aclient, benchmark_report, deep, concurrency):
+    async def _get():
+        res = await aclient.get("/api/health", params={"deep": deep})
+        return res.status_code == 200
+
+    name = f"GET /api/health?deep={str(deep).lower()}[c={concurrency}]"
+    result = await run_load(name, _get, _REQUESTS, concurrency)
+    benchmark_report.add(result)
+    assert result.errors == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency", [1, 10])
+async def test_insert(app, benchmark_report, concurrency):
+    facade = DatalayerFacade(app.db)
+    sequence = itertools.count()
+
+    async def _insert():
+        users = [
+            UsersRecordInsert(email=f"bench+{next(sequence)}@example.com")
+            for _ in range(10)
+        ]
+        return len(await facade.users.insert_many(users)) == 10
+
+    result = await run_load(
+        f"insert_many[10 rows][c={concurrency}]", _insert, _REQUESTS, concurrency
+    )
+    benchmark_report.add(result)
+    assert result.errors == 0
+
+
+@pytest.mark.asyncio
+async def test_bulk_insert(app, benchmark_report):
+    facade = DatalayerFacade(app.db)
+    sequence = itertools.count()
+
+    async def _insert():
+        rows = [(f"bulk+{next(sequence)}@example.com",) for _ in range(1000)]
+        return await facade.users.bulk_insert(rows) == 1000
+
+    result = await run_load("bulk_insert[1000 rows][c=1]", _insert, 20, 1)
+    benchmark_report.add(result)
+    assert result.errors == 0
+
+
+@pytest.mark.asyncio
+async def test_seed(postgres_url, benchmark_report):
+    await apply_migrations(postgres_url, migrations_dir)
+    db = DB(postgres_url)
+    try:
+        with mock_environ(APP_SEED_SIZE=str(_SEED_SIZE)):
+
+            async def _seed():
+                await create_some_data(db)
+                return True
+
+            result = await run_load(f"seed[{_SEED_SIZE} users]", _seed, 1, 1)
+    finally:
+        await db.disconnect()
+    benchmark_report.add(result)
@@ -0,0 +1,58 @@
+from uuid import uuid4
+
+import fastapi
+import httpx
+import pytest
+from asgi_correlation_id import CorrelationIdMiddleware
+from prometheus_client import CollectorRegistry
+from prometheus_fastapi_instrumentator import Instrumentator
+
+from app.core.request_middleware import setup_request_middleware
+from tests.testutils.benchmark import BENCHMARK_ENABLED, run_load
+
+pytestmark = pytest.mark.skipif(
+    not BENCHMARK_ENABLED, reason="set BENCHMARK=1 to run the benchmarks"
+)
+
+_REQUESTS = 5000
+
+
+def _create_app(middleware: str) -> fastapi.FastAPI:
+    app = fastapi.FastAPI()
+    if middleware == "before":
+        # what App used to set up: correlation id middleware, then the instrumentator middleware outside of it
+        app.add_middleware(
+            CorrelationIdMiddleware,
+            header_name="x-request-id",
+            update_request_header=True,
+            generator=lambda: uuid4().hex,
+            validator=lambda x: x,
+            transformer=lambda a: a,
+        )
+        Instrumentator(registry=CollectorRegistry()).instrument(app)
+    else:
+        setup_request_middleware(app)
+
+    @app.get("/ping")
+    async def ping():
+        return dict(message="pong")
+
+    return app
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("middleware", ["before", "after"])
+@pytest.mark.parametrize("concurrency", [1, 50])
+async def test_trivial_route(benchmark_report, middleware, concurrency):
+    transport = httpx.ASGITransport(app=_create_app(middleware))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+
+        async def _get():
+            res = await client.get("/ping")
+            return res.status_code == 200 and "x-request-id" in res.headers
+
+        result = await run_load(
+            f"GET /ping {middleware}[c={concurrency}]", _get, _REQUESTS, concurrency
+        )
+    benchmark_report.add(result)
+    assert result.errors == 0
@@ -0,0 +1,117 @@
+import datetime
+import time
+import uuid
+
+import pytest
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.api.users import UserResponse, render_user_response, user_row_to_json
+from app.core.responses import FastJSONResponse
+from app.datalayer.users import UsersRecord
+from app.domain.user_service import UserDto
+from tests.testutils.benchmark import BENCHMARK_ENABLED
+
+# the outputs are compared in every run, the timings only when benchmarking, they are too noisy for CI
+benchmark = pytest.mark.skipif(
+    not BENCHMARK_ENABLED, reason="set BENCHMARK=1 to run the benchmarks"
+)
+
+
+def _best_of(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _create_rows(size: int, name: str | None = None) -> list[tuple]:
+    now = datetime.datetime.now()
+    return [
+        (uuid.uuid4(), f"user+{i}@example.com", name, now, now)
+        for i in range(1, size + 1)
+    ]
+
+
+def _orm_path(rows: list[tuple]) -> bytes:
+    # what GET /api/users used to do: ORM records, UserDto per row, UserResponse, jsonable_encoder
+    records = [
+        UsersRecord(id=r[0], email=r[1], name=r[2], created_at=r[3], updated_at=r[4])
+        for r in rows
+    ]
+    data = [
+        UserDto(
+            id=r.id,
+            email=r.email,
+            name=r.name,
+            created_at=r.created_at,
+            updated_at=r.updated_at,
+        )
+        for r in records
+    ]
+    res = UserResponse(data=data, elapsed=0, size=len(rows))
+    return JSONResponse(jsonable_encoder(res)).body
+
+
+def _row_path(rows: list[tuple]) -> bytes:
+    return render_user_response(rows, elapsed=0, size=len(rows), next_cursor=None).body
+
+
+def _stdlib_path(rows: list[tuple]) -> bytes:
+    # what render_user_response used to do: convert UUID and datetime, then json.dumps
+    data = [
+        {
+            "id": str(r[0]),
+            "email": r[1],
+            "name": r[2],
+            "created_at": r[3].isoformat(),
+            "updated_at": r[4].isoformat(),
+        }
+        for r in rows
+    ]
+    return JSONResponse({"size": len(rows), "data": data}).body
+
+
+def _fast_path(rows: list[tuple]) -> bytes:
+    data = [user_row_to_json(r) for r in rows]
+    return FastJSONResponse({"size": len(rows), "data": data}).body
+
+
+def test_users_serialization():
+    rows = _create_rows(100)
+    assert _row_path(rows) == _orm_path(rows)
+
+
+@pytest.mark.parametrize("size", [100, 1000, 10000])
+def test_fast_json_response(size):
+    rows = _create_rows(size, "Zoë")
+    assert _fast_path(rows) == _stdlib_path(rows)
+
+
+@benchmark
+def test_users_serialization_benchmark():
+    size = 1000
+    rows = _create_rows(size)
+    orm_elapsed = _best_of(lambda: _orm_path(rows))
+    row_elapsed = _best_of(lambda: _row_path(rows))
+    print(
+        f"size={size} orm={size / orm_elapsed:.0f} rows/s row={size / row_elapsed:.0f} rows/s"
+        f" speedup={orm_elapsed / row_elapsed:.1f}x"
+    )
+    assert row_elapsed < orm_elapsed
+
+
+@benchmark
+@pytest.mark.parametrize("size", [100, 1000, 10000])
+def test_fast_json_response_benchmark(size):
+    rows = _create_rows(size, "Zoë")
+    stdlib_elapsed = _best_of(lambda: _stdlib_path(rows))
+    fast_elapsed = _best_of(lambda: _fast_path(rows))
+    print(
+        f"size={size} json={size / stdlib_elapsed:.0f} rows/s orjson={size / fast_elapsed:.0f} rows/s"
+        f" speedup={stdlib_elapsed / fast_elapsed:.1f}x"
+    )
+    assert fast_elapsed < stdlib_elapsed
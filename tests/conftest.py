@@ -1,3 +1,4 @@
+import contextlib
 import uuid
 
 import asyncpg
@@ -21,8 +22,8 @@ def postgres_container():
         yield postgres
 
 
-@pytest_asyncio.fixture(scope="function")
-async def postgres_url(postgres_container: PostgresContainer):
+@contextlib.asynccontextmanager
+async def _create_database(postgres_container: PostgresContainer):
     db_url = postgres_container.get_connection_url()
     db_name = "_" + uuid.uuid4().hex
     conn = await asyncpg.connect(db_url)
@@ -38,6 +39,19 @@ async def postgres_url(postgres_container: PostgresContainer):
         await conn.close()
 
 
+@pytest_asyncio.fixture(scope="function")
+async def postgres_url(postgres_container: PostgresContainer):
+    async with _create_database(postgres_container) as url:
+        yield url
+
+
+@pytest_asyncio.fixture(scope="function")
+async def replica_url(postgres_container: PostgresContainer):
+    # a second, independent database, standing in for a read replica
+    async with _create_database(postgres_container) as url:
+        yield url
+
+
 @pytest_asyncio.fixture
 async def db(postgres_url):
     await apply_migrations(postgres_url, migrations_dir)
@@ -0,0 +1,149 @@
+import asyncio
+import dataclasses
+import datetime
+import json
+import os
+import pathlib
+import subprocess
+import time
+import typing
+
+# set BENCHMARK=1 to run the benchmarks, they are skipped otherwise
+BENCHMARK_ENABLED = bool(os.getenv("BENCHMARK"))
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    name: str
+    requests: int
+    concurrency: int
+    errors: int
+    elapsed: float
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.requests} requests, concurrency {self.concurrency}, {self.errors} errors,"
+            f" {self.throughput:.0f} req/s, p50 {self.p50_ms:.1f} ms, p95 {self.p95_ms:.1f} ms,"
+            f" p99 {self.p99_ms:.1f} ms"
+        )
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+async def run_load(
+    name: str,
+    fn: typing.Callable[[], typing.Awaitable[bool]],
+    requests: int,
+    concurrency: int,
+) -> BenchmarkResult:
+    """
+    Calls fn `requests` times, from `concurrency` concurrent workers, and measures the latency of each call.
+    fn returns whether the call succeeded.
+    """
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def _worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            ok = await fn()
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return BenchmarkResult(
+        name=name,
+        requests=requests,
+        concurrency=concurrency,
+        errors=errors,
+        elapsed=elapsed,
+        throughput=requests / elapsed,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p95_ms=percentile(latencies, 95) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+    )
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkReport:
+    """
+    Collects the results of a benchmark session and saves them as JSON, named after the git revision, so that runs
+    of different commits can be compared. When a baseline file is given, every result is compared with the result of
+    the same name in the baseline.
+    """
+
+    def __init__(
+        self,
+        output_dir: pathlib.Path,
+        baseline_file: pathlib.Path | None = None,
+        max_regression: float | None = None,
+    ) -> None:
+        super().__init__()
+        self.output_dir = output_dir
+        self.revision = _git_revision()
+        self.results: dict[str, BenchmarkResult] = {}
+        self.baseline: dict[str, dict] = {}
+        if baseline_file is not None:
+            self.baseline = json.loads(baseline_file.read_text())["results"]
+        self.max_regression = max_regression
+
+    def add(self, result: BenchmarkResult) -> None:
+        self.results[result.name] = result
+        print(result)
+        baseline = self.baseline.get(result.name)
+        if baseline is None:
+            return
+        change = result.p95_ms / baseline["p95_ms"] - 1 if baseline["p95_ms"] else 0
+        print(f"{result.name}: p95 {change:+.0%} vs baseline")
+        if self.max_regression is not None:
+            assert (
+                change <= self.max_regression
+            ), f"{result.name}: p95 regressed by {change:.0%}, more than {self.max_regression:.0%}"
+
+    def save(self) -> pathlib.Path | None:
+        if not self.results:
+            return None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        now = datetime.datetime.now(datetime.UTC)
+        path = self.output_dir / f"{self.revision or now.strftime('%Y%m%d%H%M%S')}.json"
+        path.write_text(
+            json.dumps(
+                {
+                    "revision": self.revision,
+                    "created_at": now.isoformat(),
+                    "results": {
+                        k: dataclasses.asdict(v) for k, v in self.results.items()
+                    },
+                },
+                indent=2,
+            )
+        )
+        return path